@@ -1,16 +1,21 @@
 import os
+from functools import partial
 
-from flask import Flask, g
+from flask import Flask, g, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_marshmallow import Marshmallow
 from flask_cors import CORS
 
 from flask_migrate import Migrate
 from config import config
+from services.pool_metrics import configure_pool, init_pool_metrics, warm_pools
+from utils.cli import LazyGroup
+from utils.prefork import after_worker_fork, dispose_after_fork, freeze_heap
+from utils.replicas import RoutingSession, configure_replicas
 
 cors = CORS()
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 migrate = Migrate()
 ma = Marshmallow()
 
@@ -21,35 +26,64 @@ def create_app(config_name="development"):
 
     app.config.from_object(config[config_name])
 
+    configure_replicas(app)
+    configure_pool(app)
     db.init_app(app)
-    migrate.init_app(app, db)
+    from services.partitions import include_object
+
+    migrate.init_app(app, db, include_object=include_object)
     ma.init_app(app)
+    from services.metrics import init_metrics
+    from services.idempotency import init_idempotency
+    from services.passwords import init_password_pool
+    from services.query_budget import init_query_budget
+    from services.response_cache import init_response_cache
+
+    init_metrics(app)
+    if app.config.get("METRICS_ENABLED", True):
+        with app.app_context():
+            init_pool_metrics(db.engines)
+    init_query_budget(app)
+    init_response_cache(app)
+    init_password_pool(app)
+    init_idempotency(app)
     cors.init_app(
         app,
         supports_credentials=True,
         origins=["http://localhost:5173/", "http://localhost:5173",'http://127.0.0.1:5173/'],
     )
-    from commands import commands
     from blueprints.user import users
     from blueprints.transactions import transactions
     from blueprints.contractors import contractors
+    from blueprints.metrics import metrics
 
     # import here to allow for migration tracking to trigger
     from models.contractors import Contractor
     from models.transactions import Transaction
+    from models.rollups import TransactionRollup
+    from models.balances import BalanceCheckpoint
+    from models.idempotency import IdempotencyKey
     from models.token import Token
     from models.user import User
 
     # register api routes
-    app.register_blueprint(commands, url_prefix="/api")
     app.register_blueprint(users, url_prefix="/api")
     app.register_blueprint(transactions, url_prefix="/api")
     app.register_blueprint(contractors, url_prefix="/api")
+    app.register_blueprint(metrics, url_prefix="/api")
+    # CLI only, "flask commands ..." imports commands.py and its dependencies
+    app.cli.add_command(LazyGroup("commands", "commands:commands"))
     try:
         os.makedirs(app.instance_path)
     except OSError:
         pass
-    print("TEST")
+
+    from apifairy.exceptions import ValidationError
+
+    # @body validation errors, apifairy only handles them once APIFairy is set up
+    @app.errorhandler(ValidationError)
+    def validation_error(error):
+        return jsonify({"error": "Invalid request", "details": error.messages}), error.status_code
 
     # a simple page that says hello
     @app.route("/hello")
@@ -58,4 +92,20 @@ def create_app(config_name="development"):
 
     # Middleware to add new tokens to response headers/cookies
 
+    with app.app_context():
+        # connect before the first request instead of during it
+        if app.config.get("POOL_WARMUP_CONNECTIONS"):
+            warmup = partial(
+                warm_pools, dict(db.engines), app.config["POOL_WARMUP_CONNECTIONS"]
+            )
+            if app.config.get("PRELOAD_APP"):
+                # the master never serves, its connections would be dropped by
+                # every worker and sit idle in it
+                after_worker_fork(warmup)
+            else:
+                warmup()
+        dispose_after_fork(db.engines.values())
+    if app.config.get("GC_FREEZE_ON_STARTUP"):
+        freeze_heap()
+
     return app
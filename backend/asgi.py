@@ -0,0 +1,11 @@
+from dotenv import load_dotenv
+
+# before config.py reads the environment
+load_dotenv()
+
+from app import create_app  # noqa: E402
+from decouple import config
+from services.async_reads import AsyncReadApp
+
+# uvicorn asgi:app, serves the read endpoints with asyncio and the rest with Flask
+app = AsyncReadApp(create_app(config("CONFIG_NAME")))
@@ -0,0 +1,347 @@
+"""
+Microbenchmarks for the API hot paths
+
+Runs against an in-memory SQLite database seeded at the requested scale and
+writes machine readable results, so two commits can be compared:
+
+    python -m benchmarks.run --scale 10000 --output before.json
+    python -m benchmarks.run --scale 10000 --compare before.json
+
+--startup-budget MS also fails the run when a fresh create_app is slower
+than MS or imports a CLI only module.
+
+Run from the backend directory.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import timedelta
+
+from sqlalchemy import insert, select
+from werkzeug.datastructures import MultiDict
+
+from app import create_app, db
+from models.contractors import Contractor
+from models.enums import CurrencyEnum, MethodEnum, TransactionStatus
+from models.token import Token
+from models.transactions import Transaction
+from models.user import User
+from schema.transactions import TransactionSchema, dump_transaction_row
+from services.transactions import (
+    build_transactions_select,
+    paginate_cursor,
+    paginate_offset,
+    parse_transaction_filters,
+    transaction_rows_select,
+)
+from utils.utils import get_date, normalize_name
+
+BENCH_PASSWORD = "Benchmark1!"
+# imported by "flask commands" only, a web worker importing them is a regression
+CLI_ONLY_MODULES = ("commands", "faker")
+# run in a fresh interpreter so nothing is imported yet
+STARTUP_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+from app import create_app
+create_app("benchmark")
+print(json.dumps({
+    "seconds": time.perf_counter() - start,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "cli_modules": sorted(name for name in %r if name in sys.modules),
+}))
+""" % (CLI_ONLY_MODULES,)
+SORTS = ("date", "contractor", "amount")
+FILTERS = {
+    "none": {},
+    "status": {"status": TransactionStatus.PAYED.value},
+    "contractor": {"contractor_id": "1"},
+    "search": {"search": "Contractor 1"},
+}
+
+
+def seed(scale, seed_value=0):
+    """Fill the database with one user, scale // 10 contractors and scale transactions"""
+    rng = random.Random(seed_value)
+    user = User(
+        username="benchmark",
+        email="benchmark@example.com",
+        password=BENCH_PASSWORD,
+        is_verified=True,
+    )
+    db.session.add(user)
+    now = get_date()
+    contractor_count = max(scale // 10, 1)
+    db.session.execute(
+        insert(Contractor),
+        [
+            {
+                "name": f"Contractor {i}",
+                "name_normalized": normalize_name(f"Contractor {i}"),
+                "created_at": now,
+                "updated_at": now,
+            }
+            for i in range(contractor_count)
+        ],
+    )
+    contractor_uids = db.session.execute(select(Contractor.uid)).scalars().all()
+    statuses = [status.value for status in TransactionStatus]
+    currencies = [currency.value for currency in CurrencyEnum]
+    methods = [method.value for method in MethodEnum]
+    rows = []
+    for i in range(scale):
+        created_at = now - timedelta(minutes=scale - i)
+        rows.append(
+            {
+                "contractor_id": rng.choice(contractor_uids),
+                "amount": round(rng.uniform(-2000, 0), 2),
+                "currency": rng.choice(currencies),
+                "method": rng.choice(methods),
+                "status": rng.choice(statuses),
+                "tracking_id": f"{i:012d}",
+                "sent_at": created_at,
+                "created_at": created_at,
+                "updated_at": created_at,
+            }
+        )
+        if len(rows) == 5000:
+            db.session.execute(insert(Transaction), rows)
+            rows = []
+    if rows:
+        db.session.execute(insert(Transaction), rows)
+    db.session.commit()
+    return user
+
+
+def measure(func, iterations, warmup):
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "iterations": iterations,
+        "min": samples[0],
+        "mean": statistics.fmean(samples),
+        "median": statistics.median(samples),
+        "p95": samples[min(int(len(samples) * 0.95), len(samples) - 1)],
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+    }
+
+
+def measure_startup(runs):
+    """
+    Time importing app and running create_app in fresh interpreters, with the
+    peak memory and the CLI only modules they loaded
+    """
+    samples, rss, cli_modules = [], [], set()
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, "-c", STARTUP_SCRIPT], text=True)
+        sample = json.loads(output.strip().splitlines()[-1])
+        samples.append(sample["seconds"])
+        rss.append(sample["max_rss_kb"])
+        cli_modules.update(sample["cli_modules"])
+    samples.sort()
+    return {
+        "iterations": runs,
+        "min": samples[0],
+        "mean": statistics.fmean(samples),
+        "median": statistics.median(samples),
+        "p95": samples[min(int(len(samples) * 0.95), len(samples) - 1)],
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "max_rss_kb": max(rss),
+        "cli_modules": sorted(cli_modules),
+    }
+
+
+def check_startup(result, budget_ms):
+    """
+    Returns:
+        bool: True when create_app stayed within budget_ms and imported no
+            CLI only module
+    """
+    ok = True
+    if result["cli_modules"]:
+        print(f"startup imported CLI only modules: {', '.join(result['cli_modules'])}")
+        ok = False
+    if budget_ms is not None and result["median"] * 1000 > budget_ms:
+        print(f"startup took {result['median'] * 1000:.1f}ms, budget is {budget_ms:.1f}ms")
+        ok = False
+    return ok
+
+
+def benchmarks(app, user):
+    """Yield (name, callable, iteration factor) for every benchmark"""
+    client = app.test_client()
+
+    for sort_by in SORTS:
+        for filter_name, args in FILTERS.items():
+            params = MultiDict({"sort_by": sort_by, **args})
+            offset_filters = parse_transaction_filters(params)
+            params["cursor"] = ""
+            cursor_filters = parse_transaction_filters(params)
+
+            def offset_page(filters=offset_filters):
+                paginate_offset(build_transactions_select(filters), filters)
+
+            def cursor_page(filters=cursor_filters):
+                paginate_cursor(build_transactions_select(filters), filters)
+
+            label = f"sort={sort_by},filter={filter_name}"
+            yield f"get_transactions.offset[{label}]", offset_page, 1
+            yield f"get_transactions.cursor[{label}]", cursor_page, 1
+
+    yield (
+        "get_transactions.http[default]",
+        lambda: client.get("/api/get_transactions"),
+        1,
+    )
+
+    for size in (20, 100):
+        transactions = (
+            Transaction.query.order_by(Transaction.uid.desc()).limit(size).all()
+        )
+        rows = db.session.execute(
+            transaction_rows_select().order_by(Transaction.uid.desc()).limit(size)
+        ).all()
+        schema = TransactionSchema(many=True)
+        yield f"TransactionSchema.dump[{size}]", lambda t=transactions: schema.dump(t), 1
+        yield (
+            f"dump_transaction_row[{size}]",
+            lambda r=rows: [dump_transaction_row(row) for row in r],
+            1,
+        )
+
+    token = Token(user_id=user.uid)
+    token.refresh_token, _ = Token.generate_tokens()
+    access_token = token.get_access_jwt()
+    yield "Token.get_access_jwt", token.get_access_jwt, 1
+    yield "Token.decode_access_token", lambda: Token.decode_access_token(access_token), 1
+
+    # password hashing is deliberately slow, sample it less
+    yield "User.verify_password", lambda: user.verify_password(BENCH_PASSWORD), 0.1
+
+    counter = iter(range(10**9))
+    yield (
+        "add_transaction.http",
+        lambda: client.post(
+            "/api/add_transaction",
+            json={"contractor_name": f"Contractor {next(counter) % 50}", "amount": 10.0},
+        ),
+        1,
+    )
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scale, iterations, warmup, only=None, startup_runs=5):
+    results = {}
+    if startup_runs and (not only or only in "startup.create_app"):
+        results["startup.create_app"] = measure_startup(startup_runs)
+    app = create_app("benchmark")
+    with app.app_context():
+        db.create_all()
+        user = seed(scale)
+        # silence debug prints in the measured code paths
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for name, func, factor in benchmarks(app, user):
+                if only and only not in name:
+                    continue
+                results[name] = measure(
+                    func, max(int(iterations * factor), 1), max(int(warmup * factor), 1)
+                )
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scale": scale,
+            "created_at": get_date().isoformat(),
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=None):
+    """
+    Print the median change of every benchmark present in both runs
+
+    Returns:
+        bool: True when no benchmark regressed by more than threshold percent
+    """
+    ok = True
+    print(f"{'benchmark':<60} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        change = (result["median"] - before["median"]) / before["median"] * 100
+        flag = ""
+        if threshold is not None and change > threshold:
+            flag = "  REGRESSION"
+            ok = False
+        print(
+            f"{name:<60} {before['median'] * 1000:>10.3f}ms "
+            f"{result['median'] * 1000:>10.3f}ms {change:>+8.1f}%{flag}"
+        )
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=int, default=10000, help="transactions to seed")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--only", help="run benchmarks whose name contains this")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    parser.add_argument(
+        "--startup-runs", type=int, default=5, help="fresh interpreters timing create_app"
+    )
+    parser.add_argument(
+        "--startup-budget",
+        type=float,
+        help="exit 1 if create_app takes longer than this many ms or imports CLI modules",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        help="with --compare, exit 1 if a median regressed by more than this percent",
+    )
+    args = parser.parse_args(argv)
+
+    current = run(args.scale, args.iterations, args.warmup, args.only, args.startup_runs)
+    startup = current["results"].get("startup.create_app")
+    startup_ok = startup is None or check_startup(startup, args.startup_budget)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        return 0 if compare(current, baseline, args.threshold) and startup_ok else 1
+    if not args.output:
+        json.dump(current, sys.stdout, indent=2)
+        print()
+    return 0 if startup_ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
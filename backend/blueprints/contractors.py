@@ -1,14 +1,68 @@
-from flask import Blueprint
+from flask import Blueprint, current_app, jsonify, request
 from apifairy import authenticate
 from models.contractors import Contractor
 from schema.contractors import ContractorSchema
+from services.contractor_index import contractor_index
+from services.metrics import timed_serialization
+from services.query_budget import query_budget
+from services.response_cache import cached_response
 from auth import token_auth
 
 contractors = Blueprint("contractors", __name__)
 
 
 @contractors.route("/get_contractors", methods=["GET"])
+@query_budget(4)
 @authenticate(token_auth)
+@cached_response
 def get_contractors():
     schema = ContractorSchema(many=True)
-    return schema.dump(Contractor.query.all())
+    contractor_list = Contractor.query.all()
+    with timed_serialization():
+        return schema.dump(contractor_list)
+
+
+@contractors.route("/contractors", methods=["GET"])
+@query_budget(4)
+@authenticate(token_auth)
+def search_contractors():
+    """
+    Paginated contractor directory for typeahead pickers
+    Query parameters:
+    - prefix (str, optional): case insensitive start of the name
+    - page (int, optional): page number (default: 1)
+    - per_page (int, optional): items per page (default: 20, max: 100)
+    """
+    try:
+        prefix = request.args.get("prefix", "")
+        try:
+            page = max(int(request.args.get("page", 1)), 1)
+            per_page = min(max(int(request.args.get("per_page", 20)), 1), 100)
+        except (ValueError, TypeError):
+            return jsonify({"error": "page and per_page must be valid integers"}), 400
+
+        contractor_index.refresh(
+            current_app.config.get("CONTRACTOR_INDEX_REFRESH_SECONDS", 5)
+        )
+        items, total = contractor_index.search(
+            prefix, offset=(page - 1) * per_page, limit=per_page
+        )
+        return (
+            jsonify(
+                {
+                    "contractors": [{"uid": uid, "name": name} for uid, name in items],
+                    "pagination": {
+                        "page": page,
+                        "per_page": per_page,
+                        "total": total,
+                        "pages": -(-total // per_page),
+                        "has_prev": page > 1,
+                        "has_next": page * per_page < total,
+                    },
+                }
+            ),
+            200,
+        )
+
+    except Exception as e:
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
@@ -0,0 +1,34 @@
+import hmac
+
+from flask import Blueprint, Response, abort, current_app
+from flask_httpauth import HTTPTokenAuth
+
+from auth import token_auth_error, verify_token
+from services.metrics import render_metrics
+from services.pool_metrics import render_pool_metrics
+
+metrics = Blueprint("metrics", __name__)
+metrics_auth = HTTPTokenAuth()
+metrics_auth.error_handler(token_auth_error)
+
+
+@metrics_auth.verify_token
+def verify_metrics_token(token):
+    """METRICS_TOKEN when configured, for scrapers, a user access token otherwise"""
+    expected = current_app.config.get("METRICS_TOKEN")
+    if not expected:
+        return verify_token(token)
+    return bool(token) and hmac.compare_digest(token.encode(), expected.encode())
+
+
+@metrics.route("/metrics", methods=["GET"])
+@metrics_auth.login_required
+def get_metrics():
+    """
+    Per-endpoint latency, SQL time and query count histograms, and
+    connection pool stats, for Prometheus
+    """
+    if not current_app.config.get("METRICS_ENABLED", True):
+        abort(404)
+    body = render_metrics() + "\n".join(render_pool_metrics()) + "\n"
+    return Response(body, mimetype="text/plain; version=0.0.4")
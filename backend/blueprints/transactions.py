@@ -1,19 +1,40 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from apifairy import authenticate, body
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from auth import token_auth
-from sqlalchemy.orm import joinedload
 from app import db
-from models.transactions import Transaction
+from models.transactions import Transaction, TransitionError
 from schema.transactions import (
     AddTransactionSchema,
+    BulkTransitionSchema,
     TransactionSchema,
     UpdateTransactionSchema,
+    dump_transaction_row,
 )
 from models.contractors import Contractor 
+from models.rollups import TransactionRollup
 from models.enums import CurrencyEnum, TransactionStatus, MethodEnum
+from services.balances import balance_as_of, running_balance_page
+from services.archive import archive_batches, parse_archive_months
+from services.export import EXPORT_FORMATS, csv_chunks, export_batches, ndjson_chunks
+from services import idempotency
+from services.ingest import ingest_transactions, parse_ndjson
+from services.metrics import timed_serialization
+from services.query_budget import query_budget
+from services.response_cache import cached_response, data_version
+from services.transactions import (
+    MAX_PER_PAGE,
+    TransactionQueryError,
+    build_transactions_select,
+    paginate_cursor,
+    paginate_offset,
+    parse_datetime_arg,
+    parse_transaction_filters,
+)
+from utils.serialization import json_response
 from utils.utils import get_date
-import hashlib
-import uuid
+from datetime import date
 
 transactions = Blueprint("transactions", __name__)
 
@@ -21,6 +42,7 @@ transaction_schema = TransactionSchema()
 
 
 @transactions.route("/add_transaction", methods=["POST"])
+@query_budget(10)
 @authenticate(token_auth)
 @body(AddTransactionSchema)
 def add_transaction(data):
@@ -35,33 +57,43 @@ def add_transaction(data):
         "method": str (optional, defaults to TRANSACTION),
         "tracking_id": str (optional)
     }
+    With an Idempotency-Key header, retries with the same key and body get
+    the first 201 response back instead of adding another transaction.
     """
     try:
+        key = request.headers.get("Idempotency-Key")
+        if key is not None:
+            if not key or len(key) > idempotency.MAX_KEY_LENGTH:
+                return jsonify({"error": "Invalid Idempotency-Key"}), 400
+            user_id = token_auth.current_user().uid
+            request_fingerprint = idempotency.fingerprint(data)
+            try:
+                stored = idempotency.stored_response(user_id, key, request_fingerprint)
+            except idempotency.IdempotencyConflict:
+                return (
+                    jsonify({"error": "Idempotency-Key was used for a different request"}),
+                    422,
+                )
+            if stored is not None:
+                return stored.body, stored.status_code, {"Idempotent-Replayed": "true"}
+
         contractor_id = data.get("contractor_id")
         contractor_name = data.get("contractor_name")
         amount = data.get("amount")
+        contractor_uid = None
         if contractor_id:
-            print("brebre")
-            contractor = Contractor.query.get(contractor_id)
-        else:
-            contractor = Contractor.find_by_name(contractor_name)
-            print(contractor)
-        if not contractor:
-            contractor = Contractor(name=contractor_name)
-            db.session.add(contractor)
-            db.session.commit()
+            contractor = db.session.get(Contractor, contractor_id)
+            contractor_uid = contractor.uid if contractor else None
+        if contractor_uid is None:
+            contractor_uid = Contractor.get_or_create(contractor_name)
         currency = data.get("currency", CurrencyEnum.USD.value)
         method = data.get("method", MethodEnum.TRANSACTION.value)
 
         # Generate tracking_id
-        unique_string = (
-            f"{contractor.uid}_{amount}_{get_date().isoformat()}_{uuid.uuid4()}"
-        )
-        tracking_id = hashlib.sha256(unique_string.encode()).hexdigest()
-        print("berb")
+        tracking_id = Transaction.generate_tracking_id(contractor_uid, amount)
         # Create new transaction
         transaction = Transaction(
-            contractor_id=contractor.uid,
+            contractor_id=contractor_uid,
             amount=-amount,
             currency=currency,
             method=method,
@@ -71,20 +103,90 @@ def add_transaction(data):
         )
 
         db.session.add(transaction)
-        db.session.commit()
+        db.session.flush()
+        TransactionRollup.record(transaction)
+        # reload the enum and default columns, the body is stored before the commit
+        db.session.expire(transaction)
+        body = transaction_schema.dump(transaction)
+        if key is not None:
+            stored = idempotency.record_response(
+                user_id, key, request_fingerprint, 201, body, transaction.uid
+            )
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # a concurrent retry with the same key committed first
+            db.session.rollback()
+            if key is None:
+                raise
+            stored = idempotency.stored_response(user_id, key, request_fingerprint)
+            if stored is None:
+                raise
+            return stored.body, stored.status_code, {"Idempotent-Replayed": "true"}
+        data_version.bump()
+        if key is not None:
+            idempotency.remember(user_id, key, stored)
 
         return (
-            transaction_schema.dump(transaction),
+            body,
             201,
         )
 
+    except idempotency.IdempotencyConflict:
+        db.session.rollback()
+        return jsonify({"error": "Idempotency-Key was used for a different request"}), 422
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+
+@transactions.route("/transactions/bulk", methods=["POST"])
+@authenticate(token_auth)
+def add_transactions_bulk():
+    """
+    Add many transactions at once
+    Accepts either a JSON array of add_transaction payloads or, with
+    Content-Type application/x-ndjson, one payload per line read as a stream.
+    Items are inserted in chunks of BULK_INGEST_CHUNK_SIZE, one commit each.
+
+    Returns one result per item:
+    {"index": int, "status": "created", "uid": int, "tracking_id": str}
+    or {"index": int, "status": "error", "errors": ...}
+    """
+    try:
+        if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+            items = parse_ndjson(request.stream)
+        else:
+            items = request.get_json(silent=True)
+            if not isinstance(items, list):
+                return jsonify({"error": "Expected a JSON array of transactions"}), 400
+
+        results = ingest_transactions(
+            items, chunk_size=current_app.config.get("BULK_INGEST_CHUNK_SIZE", 1000)
+        )
+        created = sum(1 for result in results if result["status"] == "created")
+        if created:
+            data_version.bump()
+        return (
+            jsonify(
+                {
+                    "results": results,
+                    "created": created,
+                    "failed": len(results) - created,
+                }
+            ),
+            201 if created == len(results) else 207,
+        )
+
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
 
 @transactions.route("/get_transaction/<int:id>", methods=["GET"])
+@query_budget(5)
 @authenticate(token_auth)
+@cached_response
 def get_transaction(id):
     """
     Get a single transaction by ID
@@ -93,7 +195,8 @@ def get_transaction(id):
 
         transaction = Transaction.get_transaction_by_id(id)
         if transaction:
-            return (transaction_schema.dump(transaction), 200)
+            with timed_serialization():
+                return (transaction_schema.dump(transaction), 200)
         else:
             return {"error": "No transaction found"}, 404
     except Exception as e:
@@ -101,88 +204,99 @@ def get_transaction(id):
 
 
 @transactions.route("/get_transactions", methods=["GET"])
+@query_budget(5)
 # @authenticate(token_auth)
+@cached_response
 def get_transactions():
     """
     Get transactions with search and sort functionality
     Query parameters:
-    - search (str, optional): search by contractor name
-    - sort_by (str, optional): "date", "contractor", "amount" (default: "date")
+    - search (str, optional): search by contractor name, tracking id or amount
+    - sort_by (str, optional): "date", "contractor", "amount" or "relevance"
+      when searching (default: "date")
     - sort_order (str, optional): "asc" or "desc" (default: "desc")
     - page (int, optional): page number for pagination (default: 1)
     - per_page (int, optional): items per page (default: 20)
     - status (str, optional): filter by transaction status
     - contractor_id (int, optional): filter by specific contractor
+    - method (str, optional): filter by payment method
+    - created_from, created_to, sent_from, sent_to, payed_from, payed_to,
+      received_from, received_to (str, optional): inclusive date ranges,
+      YYYY-MM-DD or ISO datetimes
+    - amount_min, amount_max (float, optional): inclusive amount range, outgoing
+      amounts are negative
+    - cursor (str, optional): switches to keyset pagination, pass it empty for
+      the first page and then the returned next_cursor; page is ignored
+    - total (str, optional): "exact", "estimate" or "none"
+      (default: "exact" for page mode, "none" for cursor mode)
     """
     try:
-        schema = TransactionSchema(many=True)
-        # Get query parameters
-        search = request.args.get("search")
-        sort_by = request.args.get("sort_by", "date")
-        sort_order = request.args.get("sort_order", "desc").lower()
-        status = request.args.get("status")
-        contractor_id = request.args.get("contractor_id")
         try:
-            page = int(request.args.get("page", 1))
-            per_page = min(int(request.args.get("per_page", 20)), 100)
-        except (ValueError, TypeError):
-            return jsonify({"error": "page and per_page must be valid integers"}), 400
-
-        query = Transaction.query.options(joinedload(Transaction.contractor))
-
-        # Search by contractor name
-        if search:
-            search_term = f"%{search}%"
-            query = query.join(Contractor).filter(Contractor.name.ilike(search_term))
+            filters = parse_transaction_filters(request.args)
+            query = build_transactions_select(filters)
+            if filters["cursor"] is not None:
+                rows, pagination = paginate_cursor(query, filters)
+            else:
+                rows, pagination = paginate_offset(query, filters)
+        except TransactionQueryError as e:
+            return jsonify({"error": str(e)}), 400
 
-        # Filter by contractor_id
-        if contractor_id:
-            try:
-                contractor_id = int(contractor_id)
-                query = query.filter(Transaction.contractor_id == contractor_id)
-            except (ValueError, TypeError):
-                return jsonify({"error": "contractor_id must be a valid integer"}), 400
+        with timed_serialization():
+            return json_response(
+                {
+                    "transactions": [dump_transaction_row(row) for row in rows],
+                    "pagination": pagination,
+                }
+            )
 
-        # Filter by status
-        if status:
-            try:
-                status_enum = TransactionStatus(status)
-                query = query.filter(Transaction.status == status_enum.value)
-            except ValueError:
-                return jsonify({"error": f"Invalid status: {status}"}), 400
-
-        if sort_by == "date":
-            sort_column = Transaction.created_at
-        elif sort_by == "contractor":
-            if not search:
-                query = query.join(Contractor)
-            sort_column = Contractor.name
-        elif sort_by == "amount":
-            sort_column = Transaction.amount
-        else:
-            sort_column = Transaction.amount
+    except Exception as e:
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
-        if sort_order == "desc":
-            query = query.order_by(sort_column.desc())
-        else:
-            print("assc")
-            query = query.order_by(sort_column.asc())
 
-        # Execute paginated query
-        paginated_result = query.paginate(page=page, per_page=per_page, error_out=False)
+@transactions.route("/transactions/summary", methods=["GET"])
+@query_budget(4)
+@authenticate(token_auth)
+def get_transactions_summary():
+    """
+    Totals per contractor, status and currency, read from the rollup tables
+    Query parameters:
+    - contractor_id (int, optional): only this contractor
+    - status (str, optional): only this transaction status
+    - currency (str, optional): only this currency
+    - date_from (str, optional): first day included, YYYY-MM-DD
+    - date_to (str, optional): last day included, YYYY-MM-DD
+    """
+    try:
+        args = request.args
+        try:
+            contractor_id = args.get("contractor_id", type=int)
+            status = TransactionStatus(args["status"]) if args.get("status") else None
+            currency = CurrencyEnum(args["currency"]) if args.get("currency") else None
+            day_from = date.fromisoformat(args["date_from"]) if args.get("date_from") else None
+            day_to = date.fromisoformat(args["date_to"]) if args.get("date_to") else None
+        except ValueError as e:
+            return jsonify({"error": f"Invalid filter: {str(e)}"}), 400
 
+        rows = TransactionRollup.summary(
+            contractor_id=contractor_id,
+            status=status,
+            currency=currency,
+            day_from=day_from,
+            day_to=day_to,
+        )
         return (
             jsonify(
                 {
-                    "transactions": schema.dump(paginated_result.items),
-                    "pagination": {
-                        "page": paginated_result.page,
-                        "per_page": paginated_result.per_page,
-                        "total": paginated_result.total,
-                        "pages": paginated_result.pages,
-                        "has_prev": paginated_result.has_prev,
-                        "has_next": paginated_result.has_next,
-                    },
+                    "summary": [
+                        {
+                            "contractor_id": row.contractor_id,
+                            "status": row.status.value,
+                            "currency": row.currency.value,
+                            "transaction_count": row.transaction_count,
+                            "total_amount": row.total_amount,
+                        }
+                        for row in rows
+                    ]
                 }
             ),
             200,
@@ -192,7 +306,142 @@ def get_transactions():
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
 
+def _checkpoint_as_of(checkpoint):
+    return checkpoint.as_of.isoformat() if checkpoint is not None else None
+
+
+@transactions.route("/transactions/balance", methods=["GET"])
+# checkpoint lookup and the sum since it, per currency. Not response cached,
+# the process local data version would serve balances missing other workers' writes
+@query_budget(2 * len(CurrencyEnum) + 1)
+@authenticate(token_auth)
+def get_balance():
+    """
+    Balance per currency as of a moment
+    Query parameters:
+    - currency (str, optional): only this currency (default: all)
+    - as_of (str, optional): YYYY-MM-DD (end of that day) or ISO datetime
+      (default: now)
+    """
+    try:
+        args = request.args
+        try:
+            currencies = (
+                [CurrencyEnum(args["currency"])] if args.get("currency") else list(CurrencyEnum)
+            )
+            moment = (
+                parse_datetime_arg(args["as_of"], "as_of", end_of_day=True)
+                if args.get("as_of")
+                else get_date()
+            )
+        except (ValueError, TransactionQueryError) as e:
+            return jsonify({"error": f"Invalid filter: {str(e)}"}), 400
+
+        balances = []
+        for currency in currencies:
+            balance, count, checkpoint = balance_as_of(currency, moment)
+            balances.append(
+                {
+                    "currency": currency.value,
+                    "balance": balance,
+                    "transaction_count": count,
+                    "checkpoint": _checkpoint_as_of(checkpoint),
+                }
+            )
+        return json_response({"as_of": moment.isoformat(), "balances": balances})
+
+    except Exception as e:
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+
+@transactions.route("/transactions/running_balance", methods=["GET"])
+@query_budget(6)
+@authenticate(token_auth)
+def get_running_balance():
+    """
+    Transactions of one currency, newest first, each with the balance after it
+    Query parameters:
+    - currency (str, optional): (default: "USD")
+    - as_of (str, optional): only transactions up to this date or datetime
+    - page (int, optional): page number for pagination (default: 1)
+    - per_page (int, optional): items per page (default: 20)
+    """
+    try:
+        args = request.args
+        try:
+            currency = CurrencyEnum(args.get("currency", CurrencyEnum.USD.value))
+            moment = (
+                parse_datetime_arg(args["as_of"], "as_of", end_of_day=True)
+                if args.get("as_of")
+                else None
+            )
+            page = max(int(args.get("page", 1)), 1)
+            per_page = min(max(int(args.get("per_page", 20)), 1), MAX_PER_PAGE)
+        except (ValueError, TransactionQueryError) as e:
+            return jsonify({"error": f"Invalid filter: {str(e)}"}), 400
+
+        rows, pagination, checkpoint = running_balance_page(currency, page, per_page, moment)
+        with timed_serialization():
+            return json_response(
+                {
+                    "currency": currency.value,
+                    "transactions": rows,
+                    "pagination": pagination,
+                    "checkpoint": _checkpoint_as_of(checkpoint),
+                }
+            )
+
+    except Exception as e:
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+
+@transactions.route("/transactions/export", methods=["GET"])
+@query_budget(3)
+@authenticate(token_auth)
+def export_transactions():
+    """
+    Stream every transaction matching the get_transactions filters
+    Query parameters:
+    - format (str, optional): "csv" or "ndjson" (default: "csv")
+    - search, sort_by, sort_order and the filters of get_transactions
+    - archive (str, optional): comma separated YYYY-MM months or "all", read
+      the archived months instead of the database, in date order and
+      without search
+    """
+    try:
+        export_format = request.args.get("format", "csv").lower()
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({"error": f"Invalid format: {export_format}"}), 400
+        batch_size = current_app.config.get("EXPORT_BATCH_SIZE", 1000)
+        try:
+            filters = parse_transaction_filters(request.args)
+            if request.args.get("archive"):
+                if filters["search"]:
+                    raise TransactionQueryError("archives can not be searched")
+                directory = current_app.config["ARCHIVE_DIR"]
+                months = parse_archive_months(request.args["archive"], directory)
+        except TransactionQueryError as e:
+            return jsonify({"error": str(e)}), 400
+
+        if request.args.get("archive"):
+            batches = archive_batches(directory, months, filters, batch_size)
+        else:
+            batches = export_batches(filters, batch_size=batch_size)
+        chunks = csv_chunks(batches) if export_format == "csv" else ndjson_chunks(batches)
+        return Response(
+            stream_with_context(chunks),
+            mimetype=EXPORT_FORMATS[export_format],
+            headers={
+                "Content-Disposition": f"attachment; filename=transactions.{export_format}"
+            },
+        )
+
+    except Exception as e:
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+
 @transactions.route("/update_transaction", methods=["PUT"])
+@query_budget(8)
 @authenticate(token_auth)
 @body(UpdateTransactionSchema)
 def update_transaction(data):
@@ -213,6 +462,7 @@ def update_transaction(data):
 
         transaction.update(**data)
         db.session.commit()
+        data_version.bump()
 
         return (
             transaction_schema.dump(transaction),
@@ -222,3 +472,68 @@ def update_transaction(data):
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+
+@transactions.route("/transactions/transition", methods=["POST"])
+@query_budget(6)
+@authenticate(token_auth)
+@body(BulkTransitionSchema)
+def bulk_transition(data):
+    """
+    Move many transactions to one status at once
+    Expected JSON payload:
+    {
+        "status": str (required),
+        "transaction_ids": [int] (either this),
+        "filter": {get_transactions query parameters} (or this)
+    }
+    Listed ids are all moved or, when any of them can not make the
+    transition, none is and a 409 lists them. Filtered rows that can not make
+    it are skipped.
+    """
+    try:
+        try:
+            status = TransactionStatus(data["status"])
+        except ValueError:
+            return jsonify({"error": f"Invalid status: {data['status']}"}), 400
+
+        uids, where = data.get("transaction_ids"), None
+        if (uids is None) == (not data.get("filter")):
+            return jsonify({"error": "Send either transaction_ids or filter"}), 400
+        if uids is not None:
+            max_ids = current_app.config.get("BULK_TRANSITION_MAX_IDS", 10000)
+            if len(uids) > max_ids:
+                return jsonify({"error": f"At most {max_ids} transaction_ids"}), 400
+        else:
+            try:
+                filters = parse_transaction_filters(data["filter"])
+            except TransactionQueryError as e:
+                return jsonify({"error": f"Invalid filter: {str(e)}"}), 400
+            where = build_transactions_select(
+                filters, select(Transaction.uid)
+            ).order_by(None)
+
+        try:
+            moved = Transaction.bulk_transition(status, uids, where)
+        except TransitionError as e:
+            db.session.rollback()
+            return (
+                jsonify(
+                    {
+                        "error": str(e),
+                        "rejected": [
+                            {"uid": uid, "status": old.value if old else None}
+                            for uid, old in e.rejected
+                        ],
+                    }
+                ),
+                409,
+            )
+        db.session.commit()
+        if moved:
+            data_version.bump()
+        return jsonify({"status": status.value, "updated": len(moved), "uids": moved}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
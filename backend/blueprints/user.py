@@ -1,16 +1,24 @@
-from flask import Blueprint, abort, request
+from flask import Blueprint, abort, current_app, request
 from apifairy import authenticate, body, response, other_responses
 from models.token import Token
 
 from models.user import User
 from schema.users import UserSchema, LoginSchema, RegisterSchema
 from schema.tokens import TokenSchema
+from services.passwords import PasswordPoolBusy, needs_rehash
+from services.token_filter import refresh_token_filter
 from auth import token_auth
 from app import db
 from utils.utils import get_date
 
 users = Blueprint("users", __name__)
 
+PASSWORD_POOL_BUSY = (
+    {"error": "Too many sign-ins in progress, try again shortly"},
+    503,
+    {"Retry-After": "1"},
+)
+
 
 @users.route("/login", methods=["POST"])
 @body(LoginSchema)
@@ -20,15 +28,27 @@ def login(args):
     user = User.get_user_by_username(username)
     if user is None:
         return {"error": "No user found"}, 404
-    print(user.verify_password(password))
-    result = user.verify_password(password)
+    try:
+        result = user.verify_password(password)
+    except PasswordPoolBusy:
+        return PASSWORD_POOL_BUSY
     if not result:
         return {"error": "Incorrect password"}, 403
+    if needs_rehash(user.password_hash):
+        # hash parameters changed since this password was set
+        try:
+            user.password = password
+        except PasswordPoolBusy:
+            pass
     raw_token, refresh_token_hash = Token.generate_tokens()
     token = Token(user_id=user.uid, refresh_token=refresh_token_hash)
     token.set_refresh_token_date()
     db.session.add(token)
+    db.session.flush()
+    # the oldest sessions of the user are signed out beyond the cap
+    Token.trim_sessions(current_app.config.get("TOKEN_MAX_SESSIONS", 10), user.uid)
     db.session.commit()
+    refresh_token_filter.add(refresh_token_hash)
 
     return Token.token_response(token, raw_token)
 
@@ -36,8 +56,12 @@ def login(args):
 @users.route("/get_user", methods=["GET"])
 @authenticate(token_auth)
 @response(UserSchema)
-def get_user(args):
-    user = token_auth.current_user()
+def get_user():
+    current_user = token_auth.current_user()
+    if current_user is None:
+        return {"error": "No user is found"}, 404
+    # the access token snapshot has no email, load the full user
+    user = User.get_user_by_id(current_user.uid)
     if user is None:
         return {"error": "No user is found"}, 404
     return user
@@ -87,6 +111,9 @@ def register():
         # Return the created user (will be serialized by @response decorator)
         return new_user
 
+    except PasswordPoolBusy:
+        db.session.rollback()
+        return PASSWORD_POOL_BUSY
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": f"Registration failed: {str(e)}"}), 500
@@ -94,7 +121,7 @@ def register():
 
 @users.route("/tokens", methods=["PUT"])
 @response(TokenSchema, description="Newly issued access and refresh tokens")
-def refresh(args):
+def refresh():
     """Refresh an access token"""
     refresh_token = request.cookies.get("refresh_token")
     if not refresh_token:
@@ -1,56 +1,401 @@
-from flask import Blueprint
+from flask import Blueprint, current_app
 from models.transactions import Transaction
 from models.user import User
 from models.contractors import Contractor
 from models.token import Token
-from faker import Faker
+from models.rollups import TransactionRollup
+from models.balances import BalanceCheckpoint
+from models.idempotency import IdempotencyKey
+from services import archive, partitions
+from models.enums import CurrencyEnum, MethodEnum, TransactionStatus
+from services import data_generator, passwords, search
+from sqlalchemy import select
+from utils.utils import get_date, normalize_name
 from app import db
-import random
-import string
+import click
+import csv
+import io
+import multiprocessing
+import os
+import time
 
 commands = Blueprint("commands", __name__)
-faker = Faker()
+
+
+def _weights_option(enum_class):
+    def callback(ctx, param, value):
+        try:
+            return data_generator.parse_weights(value, enum_class)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+
+    return callback
+
+
+def _insert_transactions(rows):
+    """Insert generated rows, with COPY on PostgreSQL and executemany elsewhere"""
+    connection = db.session.connection()
+    if connection.dialect.name == "postgresql":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        with connection.connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY transactions ({', '.join(data_generator.TRANSACTION_COLUMNS)}) "
+                "FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+    else:
+        connection.execute(
+            Transaction.__table__.insert(),
+            [dict(zip(data_generator.TRANSACTION_COLUMNS, row)) for row in rows],
+        )
 
 
 @commands.cli.command()
-def fill_db():
+@click.option("--users", default=10, show_default=True)
+@click.option("--contractors", default=500, show_default=True)
+@click.option("--transactions", default=1000, show_default=True)
+@click.option("--chunk-size", default=10000, show_default=True, help="rows per commit")
+@click.option(
+    "--workers",
+    default=os.cpu_count() or 1,
+    show_default=True,
+    help="processes generating transactions",
+)
+@click.option("--seed", type=int, default=None, help="makes the dataset reproducible")
+@click.option("--days", default=365, show_default=True, help="created_at spread")
+@click.option(
+    "--status-weights",
+    default=data_generator.DEFAULT_STATUS_WEIGHTS,
+    show_default=True,
+    callback=_weights_option(TransactionStatus),
+)
+@click.option(
+    "--currency-weights",
+    default=data_generator.DEFAULT_CURRENCY_WEIGHTS,
+    show_default=True,
+    callback=_weights_option(CurrencyEnum),
+)
+@click.option(
+    "--method-weights",
+    default=data_generator.DEFAULT_METHOD_WEIGHTS,
+    show_default=True,
+    callback=_weights_option(MethodEnum),
+)
+@click.option("--amount-mu", default=4.5, show_default=True, help="lognormal mu")
+@click.option("--amount-sigma", default=1.2, show_default=True, help="lognormal sigma")
+def fill_db(
+    users,
+    contractors,
+    transactions,
+    chunk_size,
+    workers,
+    seed,
+    days,
+    status_weights,
+    currency_weights,
+    method_weights,
+    amount_mu,
+    amount_sigma,
+):
+    """Fill the database with synthetic users, contractors and transactions"""
+    from faker import Faker
+
     faker = Faker("en_UK")
-    db.session.configure()  # This might help with the registry issue
-    try:
-        # generate 10 users with passwords set to admin
-        for _ in range(10):
-            base_email = faker.email()
-            print(base_email)
-            username = faker.simple_profile()["username"]
-            print(username)
-            user = User(
-                email=base_email, username=username, password="admin", is_verified=True
+    if seed is not None:
+        faker.seed_instance(seed)
+    started = time.perf_counter()
+    try:
+        # all generated users share the password admin, hash it once
+        password_hash = passwords.hash_password("admin")
+        now = get_date()
+        if users:
+            db.session.execute(
+                User.__table__.insert(),
+                [
+                    {
+                        "username": f"{faker.user_name()}_{i}",
+                        "email": faker.email(),
+                        "password_hash": password_hash,
+                        "is_verified": True,
+                        "created_at": now,
+                        "updated_at": now,
+                    }
+                    for i in range(users)
+                ],
             )
-            print(user)
-            user.tokens = []
-            db.session.add(user)
-        # generate 500 contractors and random number of transactions per contractor
-        for _ in range(500):
-            contractor = Contractor(name=f"{faker.company()} {faker.company_suffix()}")
-            db.session.add(contractor)
-            db.session.flush()
-            for _ in range(2):
-                method = "card payment"
-                amount = round(random.uniform(-2000, 0), 2)
-                # Generate random tracking ID
-                tracking_id = "".join(
-                    random.choices(string.ascii_uppercase + string.digits, k=10)
-                )
-                transaction = Transaction(
-                    contractor_id=contractor.uid,
-                    currency="USD",
-                    tracking_id=tracking_id,
-                    method=method,
-                    amount=amount,
-                    status="sent",
+            db.session.commit()
+
+        names = set()
+        for i in range(contractors):
+            name = f"{faker.company()} {faker.company_suffix()}"
+            names.add(name if name not in names else f"{name} {i}")
+        contractor_uids = []
+        names = sorted(names)
+        for start in range(0, len(names), chunk_size):
+            chunk = names[start : start + chunk_size]
+            contractor_uids.extend(Contractor.get_or_create_many(chunk).values())
+            db.session.commit()
+        click.echo(f"{users} users and {len(contractor_uids)} contractors")
+
+        if transactions and contractor_uids:
+            specs = data_generator.chunk_specs(
+                transactions,
+                chunk_size,
+                seed=seed,
+                end=now,
+                days=days,
+                statuses=status_weights,
+                currencies=currency_weights,
+                methods=method_weights,
+                amount_mu=amount_mu,
+                amount_sigma=amount_sigma,
+            )
+            inserted = 0
+            with multiprocessing.Pool(
+                max(workers, 1),
+                initializer=data_generator.init_worker,
+                initargs=(contractor_uids,),
+            ) as pool:
+                for rows in pool.imap(data_generator.generate_chunk, specs):
+                    _insert_transactions(rows)
+                    db.session.commit()
+                    inserted += len(rows)
+                    elapsed = time.perf_counter() - started
+                    click.echo(
+                        f"{inserted}/{transactions} transactions "
+                        f"({inserted / elapsed:,.0f} rows/s)"
+                    )
+
+        TransactionRollup.rebuild()
+        # generated rows are back-dated, so existing checkpoints are wrong
+        BalanceCheckpoint.rebuild(current_app.config.get("BALANCE_CHECKPOINT_DAYS", 1))
+        click.echo(f"Done in {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+    return ""
+
+
+@commands.cli.command()
+def rebuild_rollups():
+    """Recompute the transaction rollup tables from scratch"""
+    try:
+        TransactionRollup.rebuild()
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+    return ""
+
+
+@commands.cli.command()
+def create_search_index():
+    """Create the transaction search index for the configured database"""
+    try:
+        backend = search.indexed_backend()
+        backend.create_index()
+        search._backends.clear()
+        print(f"Created {backend.name} search index")
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+    return ""
+
+
+@commands.cli.command()
+def backfill_contractor_names():
+    """Set name_normalized on contractors created before it existed"""
+    try:
+        seen = set(
+            db.session.execute(
+                select(Contractor.name_normalized).where(
+                    Contractor.name_normalized.is_not(None)
                 )
-                db.session.add(transaction)
+            ).scalars()
+        )
+        contractors = (
+            Contractor.query.filter(Contractor.name_normalized.is_(None))
+            .order_by(Contractor.uid)
+            .all()
+        )
+        for contractor in contractors:
+            key = normalize_name(contractor.name)
+            if key in seen:
+                # keep the oldest contractor as the one get_or_create returns
+                print(f"Skipping duplicate contractor {contractor.uid}: {contractor.name}")
+                continue
+            contractor.name_normalized = key
+            seen.add(key)
+        db.session.commit()
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+    return ""
+
+
+@commands.cli.command()
+def sync_replicas():
+    """Copy a SQLite primary into its SQLite replicas, for trying replica routing locally"""
+    try:
+        primary = db.engine
+        replica_keys = [key for key in db.engines if key and key.startswith("replica_")]
+        if not replica_keys:
+            print("No replicas configured, set SQLALCHEMY_REPLICA_URIS")
+            return ""
+        if primary.dialect.name != "sqlite":
+            print("Only SQLite replicas are synced here, use the database's own replication")
+            return ""
+        source = primary.raw_connection()
+        try:
+            for key in replica_keys:
+                target = db.engines[key].raw_connection()
+                try:
+                    source.driver_connection.backup(target.driver_connection)
+                finally:
+                    target.close()
+                print(f"Synced {key}")
+        finally:
+            source.close()
+    except Exception as e:
+        print(e)
+    return ""
+
+
+@commands.cli.command()
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=1000,
+    show_default=True,
+    help="tokens per delete",
+)
+@click.option(
+    "--max-sessions",
+    type=int,
+    default=None,
+    help="also trim every user to this many live tokens, defaults to TOKEN_MAX_SESSIONS",
+)
+def sweep_tokens(batch_size, max_sessions):
+    """Delete expired refresh tokens and tokens beyond the per-user session cap"""
+    try:
+        expired = Token.sweep_expired(batch_size)
+        if max_sessions is None:
+            max_sessions = current_app.config.get("TOKEN_MAX_SESSIONS", 10)
+        trimmed = Token.trim_sessions(max_sessions)
+        db.session.commit()
+        print(f"Deleted {expired} expired and {trimmed} surplus tokens")
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+    return ""
+
+
+@commands.cli.command()
+@click.argument("username")
+def revoke_tokens(username):
+    """Sign a user out everywhere by revoking all of their tokens"""
+    try:
+        user = User.get_user_by_username(username)
+        if user is None:
+            print(f"No user named {username}")
+            return ""
+        user.revoke_tokens()
+        print(f"Revoked the tokens of {username}")
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+    return ""
+
+
+@commands.cli.command()
+@click.option("--days", type=int, default=None, help="defaults to BALANCE_CHECKPOINT_DAYS")
+@click.option("--rebuild", is_flag=True, help="drop and recompute every checkpoint")
+def create_balance_checkpoints(days, rebuild):
+    """Snapshot per currency balances up to the start of today, run daily"""
+    try:
+        if days is None:
+            days = current_app.config.get("BALANCE_CHECKPOINT_DAYS", 1)
+        if rebuild:
+            created = BalanceCheckpoint.rebuild(days)
+        else:
+            created = BalanceCheckpoint.create(days)
+        print(f"Created {created} balance checkpoints")
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+    return ""
+
+
+@commands.cli.command()
+@click.option("--batch-size", type=click.IntRange(min=1), default=1000)
+def sweep_idempotency_keys(batch_size):
+    """Delete Idempotency-Key responses older than IDEMPOTENCY_KEY_TTL_HOURS"""
+    try:
+        deleted = IdempotencyKey.sweep_expired(
+            current_app.config.get("IDEMPOTENCY_KEY_TTL_HOURS", 24), batch_size
+        )
+        print(f"Deleted {deleted} idempotency keys")
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+    return ""
+
+
+@commands.cli.command()
+@click.option("--months-ahead", type=int, default=None, help="defaults to PARTITION_MONTHS_AHEAD")
+def partition_transactions(months_ahead):
+    """Convert transactions to monthly partitions on created_at, PostgreSQL only"""
+    try:
+        if months_ahead is None:
+            months_ahead = current_app.config.get("PARTITION_MONTHS_AHEAD", 3)
+        created, dropped = partitions.partition_transactions(
+            db.session.connection(), months_ahead
+        )
+        db.session.commit()
+        print(f"Partitioned transactions into {len(created)} months")
+        if dropped:
+            # the new primary key is (uid, created_at), nothing can reference uid alone
+            print(f"Dropped foreign keys to transactions.uid: {', '.join(dropped)}")
+        print("Run create-search-index again to rebuild the search index")
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+    return ""
+
+
+@commands.cli.command()
+@click.option("--months-ahead", type=int, default=None, help="defaults to PARTITION_MONTHS_AHEAD")
+def create_partitions(months_ahead):
+    """Create the monthly transaction partitions that are due, run monthly"""
+    try:
+        if months_ahead is None:
+            months_ahead = current_app.config.get("PARTITION_MONTHS_AHEAD", 3)
+        created = partitions.create_partitions(db.session.connection(), months_ahead)
+        db.session.commit()
+        print(f"Created {len(created)} partitions")
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+    return ""
+
+
+@commands.cli.command()
+@click.option("--keep-months", type=int, default=None, help="defaults to ARCHIVE_KEEP_MONTHS")
+def archive_transactions(keep_months):
+    """Move partitions older than keep_months to gzipped CSVs in ARCHIVE_DIR"""
+    try:
+        if keep_months is None:
+            keep_months = current_app.config.get("ARCHIVE_KEEP_MONTHS", 12)
+        cutoff = partitions.add_months(partitions.month_start(get_date()), -keep_months)
+        months = partitions.list_partitions(db.session.connection())
+        # archive_partition runs its own short transactions
         db.session.commit()
+        for month, name in months:
+            if month >= cutoff:
+                break
+            count = archive.archive_partition(db.engine, month, current_app.config["ARCHIVE_DIR"])
+            print(f"Archived {count} transactions of {name}")
     except Exception as e:
         print(e)
         db.session.rollback()
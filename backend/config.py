@@ -1,7 +1,6 @@
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
+# .env is loaded by the entry points (run.py, asgi.py, the flask CLI)
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 
@@ -15,17 +14,100 @@ sqlalchemy_pool_size = os.environ.get("SQLALCHEMY_POOL_SIZE") or 2
 sqlalchemy_max_overflow = os.environ.get("SQLALCHEMY_MAX_OVERFLOW") or 3
 
 
+def engine_options(pre_ping=False, recycle=1800):
+    """
+    Pool options, SQLALCHEMY_POOL_RECYCLE and SQLALCHEMY_POOL_PRE_PING
+    override the per environment defaults
+    """
+    return {
+        "pool_size": int(sqlalchemy_pool_size),
+        "max_overflow": int(sqlalchemy_max_overflow),
+        # seconds before a connection is replaced, -1 never
+        "pool_recycle": int(os.environ.get("SQLALCHEMY_POOL_RECYCLE") or recycle),
+        # a round trip on every checkout, only worth it when connections get cut
+        "pool_pre_ping": as_bool(os.environ.get("SQLALCHEMY_POOL_PRE_PING") or str(pre_ping)),
+        # seconds to wait for a connection from the pool
+        "pool_timeout": int(os.environ.get("SQLALCHEMY_POOL_TIMEOUT") or 30),
+    }
+
+
 class Config(object):
     """
     Config File with all env configurations present_
     """
     SECRET_KEY = os.environ.get("SECRET_KEY")
+    # "auto" uses pg_trgm / FTS5 once create_search_index has run, "like" never does
+    SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND") or "auto"
+    # seconds before "auto" checks again whether the search indexes exist
+    SEARCH_BACKEND_CHECK_SECONDS = float(os.environ.get("SEARCH_BACKEND_CHECK_SECONDS") or 60)
+    BULK_INGEST_CHUNK_SIZE = int(os.environ.get("BULK_INGEST_CHUNK_SIZE") or 1000)
+    EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE") or 1000)
+    CONTRACTOR_INDEX_REFRESH_SECONDS = float(
+        os.environ.get("CONTRACTOR_INDEX_REFRESH_SECONDS") or 5
+    )
+    # GET responses cached per data version, TTL bounds staleness across workers
+    RESPONSE_CACHE_ENABLED = as_bool(os.environ.get("RESPONSE_CACHE_ENABLED") or "true")
+    RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE") or 1024)
+    RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL") or 10)
+    # Server-Timing headers and the /api/metrics histograms
+    METRICS_ENABLED = as_bool(os.environ.get("METRICS_ENABLED") or "true")
+    # bearer token for Prometheus, unset /api/metrics takes a user access token
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+    # "off", "log" or "raise" when a view exceeds its @query_budget or repeats lazy
+    # loads, "raise" only fails GET and HEAD requests, writes are logged
+    QUERY_BUDGET_MODE = os.environ.get("QUERY_BUDGET_MODE") or "off"
+    N_PLUS_ONE_THRESHOLD = int(os.environ.get("N_PLUS_ONE_THRESHOLD") or 3)
+    # comma separated read replica uris, GET requests read from them round robin
+    REPLICA_DATABASE_URIS = [
+        uri.strip()
+        for uri in (os.environ.get("SQLALCHEMY_REPLICA_URIS") or "").split(",")
+        if uri.strip()
+    ]
+    # reads stay on the primary this long after a write, and lagging replicas are skipped
+    REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS") or 1)
+    REPLICA_LAG_CHECK_SECONDS = float(os.environ.get("REPLICA_LAG_CHECK_SECONDS") or 5)
+    # connections of the asyncio read mode (asgi.py), shared by all in-flight reads
+    ASYNC_POOL_SIZE = int(os.environ.get("ASYNC_POOL_SIZE") or 20)
+    ASYNC_MAX_OVERFLOW = int(os.environ.get("ASYNC_MAX_OVERFLOW") or 10)
+    # werkzeug method with every parameter spelled out, changing it rehashes on login
+    PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD") or "scrypt:32768:8:1"
+    # hashing processes, 0 hashes in the request thread
+    PASSWORD_POOL_WORKERS = int(os.environ.get("PASSWORD_POOL_WORKERS") or 2)
+    # hashes allowed to wait for a worker before requests get a 503
+    PASSWORD_POOL_QUEUE_SIZE = int(os.environ.get("PASSWORD_POOL_QUEUE_SIZE") or 16)
+    PASSWORD_POOL_TIMEOUT = float(os.environ.get("PASSWORD_POOL_TIMEOUT") or 10)
+    # live refresh tokens per user, login signs out the oldest beyond it
+    TOKEN_MAX_SESSIONS = int(os.environ.get("TOKEN_MAX_SESSIONS") or 10)
+    # bloom filter rejecting unknown refresh tokens without a query
+    TOKEN_FILTER_ENABLED = as_bool(os.environ.get("TOKEN_FILTER_ENABLED") or "true")
+    TOKEN_FILTER_REBUILD_SECONDS = float(os.environ.get("TOKEN_FILTER_REBUILD_SECONDS") or 300)
+    # Idempotency-Key rows are kept this long, recent ones are also cached in memory
+    IDEMPOTENCY_KEY_TTL_HOURS = int(os.environ.get("IDEMPOTENCY_KEY_TTL_HOURS") or 24)
+    IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("IDEMPOTENCY_CACHE_SIZE") or 10000)
+    # PostgreSQL monthly partitions of transactions, see services.partitions
+    PARTITION_MONTHS_AHEAD = int(os.environ.get("PARTITION_MONTHS_AHEAD") or 3)
+    ARCHIVE_KEEP_MONTHS = int(os.environ.get("ARCHIVE_KEEP_MONTHS") or 12)
+    ARCHIVE_DIR = os.environ.get("TRANSACTIONS_ARCHIVE_DIR") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "archive"
+    )
+    # connections opened per pool by create_app, or by each worker after the
+    # fork with PRELOAD_APP, 0 connects on first use
+    POOL_WARMUP_CONNECTIONS = int(os.environ.get("POOL_WARMUP_CONNECTIONS") or 0)
+    # create_app runs in a pre-forking master (gunicorn --preload, see gunicorn.conf.py)
+    PRELOAD_APP = as_bool(os.environ.get("PRELOAD_APP") or "false")
+    # gc.freeze() at the end of create_app, keeps preloaded pages shared with
+    # workers. Only pays off in a pre-forking master, see ProductionConfig
+    GC_FREEZE_ON_STARTUP = as_bool(os.environ.get("GC_FREEZE_ON_STARTUP") or "false")
+    BULK_TRANSITION_MAX_IDS = int(os.environ.get("BULK_TRANSITION_MAX_IDS") or 10000)
+    # days between balance checkpoints, as-of balances only scan rows since the last one
+    BALANCE_CHECKPOINT_DAYS = int(os.environ.get("BALANCE_CHECKPOINT_DAYS") or 1)
 
 
 class DevelopmentConfig(Config):
     ENV_NAME = "development"
     SECRET_KEY = os.environ.get("SECRET_KEY")
     DEBUG = True
+    QUERY_BUDGET_MODE = os.environ.get("QUERY_BUDGET_MODE") or "log"
     # DEVELOPMENT DATABASE
     SQLALCHEMY_DATABASE_URI = os.environ.get("SQLALCHEMY_DATABASE_URI_DEV")
     SQLALCHEMY_BINDS = {
@@ -34,13 +116,7 @@ class DevelopmentConfig(Config):
 
     SQLALCHEMY_ECHO = as_bool(os.environ.get("SQLALCHEMY_ECHO") or "false")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_ENGINE_OPTIONS = {
-        "pool_size": int(sqlalchemy_pool_size),
-        "max_overflow": int(sqlalchemy_max_overflow),
-        "pool_recycle": 60,  # Recycle connections every 30 minutes
-        "pool_pre_ping": True,  # Enable pre-ping to check connection validity
-        "pool_timeout": 30,  # Timeout for acquiring a connection from the pool
-    }
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options()
 
 
 class ProductionConfig(Config):
@@ -49,32 +125,40 @@ class ProductionConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get("SQLALCHEMY_DATABASE_URI_PRODUCTION")
     SQLALCHEMY_ECHO = as_bool(os.environ.get("SQLALCHEMY_ECHO") or "false")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_ENGINE_OPTIONS = {
-        "pool_size": int(sqlalchemy_pool_size),
-        "max_overflow": int(sqlalchemy_max_overflow),
-        "pool_recycle": 60,  # Recycle connections every 30 minutes
-        "pool_pre_ping": True,  # Enable pre-ping to check connection validity
-        "pool_timeout": 30,  # Timeout for acquiring a connection from the pool
-    }
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(pre_ping=True)
+    POOL_WARMUP_CONNECTIONS = int(
+        os.environ.get("POOL_WARMUP_CONNECTIONS") or sqlalchemy_pool_size
+    )
+    # production runs under gunicorn --preload, PRELOAD_APP=false opts out
+    PRELOAD_APP = as_bool(os.environ.get("PRELOAD_APP") or "true")
+    GC_FREEZE_ON_STARTUP = as_bool(os.environ.get("GC_FREEZE_ON_STARTUP") or str(PRELOAD_APP))
 
 
 class TestingConfig(Config):
     ENV_NAME = "testing"
+    QUERY_BUDGET_MODE = os.environ.get("QUERY_BUDGET_MODE") or "raise"
     # DEVELOPMENT DATABASE
     SQLALCHEMY_DATABASE_URI = os.environ.get("SQLALCHEMY_DATABASE_URI_TEST")
     SQLALCHEMY_ECHO = as_bool(os.environ.get("SQLALCHEMY_ECHO") or "false")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_ENGINE_OPTIONS = {
-        "pool_size": int(sqlalchemy_pool_size),
-        "max_overflow": int(sqlalchemy_max_overflow),
-        "pool_recycle": 60,  # Recycle connections every 30 minutes
-        "pool_pre_ping": True,  # Enable pre-ping to check connection validity
-        "pool_timeout": 30,  # Timeout for acquiring a connection from the pool
-    }
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options()
+
+
+class BenchmarkConfig(Config):
+    ENV_NAME = "benchmark"
+    SECRET_KEY = "benchmark-only-secret-key-not-for-deployment"
+    # in-memory database seeded by benchmarks/run.py
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    # measure the endpoints themselves, not the response cache
+    RESPONSE_CACHE_ENABLED = False
+    REPLICA_DATABASE_URIS = []
 
 
 config = {
     "development": DevelopmentConfig,
     "production": ProductionConfig,
     "testing": TestingConfig,
+    "benchmark": BenchmarkConfig,
 }
@@ -0,0 +1,14 @@
+# gunicorn run:app, read from the working directory
+import os
+
+bind = os.environ.get("GUNICORN_BIND") or "0.0.0.0:8000"
+workers = int(os.environ.get("GUNICORN_WORKERS") or 4)
+# create_app once in the master, workers share its pages, see PRELOAD_APP
+preload_app = True
+
+
+def post_fork(server, worker):
+    from utils.prefork import run_worker_hooks
+
+    # pool warm-up registered by create_app, in the worker that will serve
+    run_worker_hooks()
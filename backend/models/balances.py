@@ -0,0 +1,126 @@
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import delete, func, insert, select
+
+from app import db
+from utils.utils import get_date
+from models.enums import CurrencyEnum
+from models.transactions import Transaction
+
+
+class BalanceCheckpoint(db.Model):
+    """
+    Balance of one currency over every transaction created before as_of
+
+    Checkpoints are only written for periods that have ended, and new
+    transactions are always created now, so they stay valid until rows are
+    back-dated (fill_db) and rebuild runs.
+    """
+
+    __tablename__ = "balance_checkpoints"
+    __table_args__ = (
+        db.UniqueConstraint("currency", "as_of", name="uq_balance_checkpoints_as_of"),
+    )
+
+    uid = db.Column(db.Integer, primary_key=True)
+    currency = db.Column(
+        db.Enum(CurrencyEnum, values_callable=lambda obj: [e.value for e in obj]),
+        nullable=False,
+    )
+    as_of = db.Column(db.DateTime, nullable=False)
+    balance = db.Column(db.Float, nullable=False, default=0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def latest(currency, moment=None):
+        """Newest checkpoint of currency at or before moment, None if there is none"""
+        query = select(BalanceCheckpoint).where(BalanceCheckpoint.currency == currency.value)
+        if moment is not None:
+            query = query.where(BalanceCheckpoint.as_of <= moment)
+        return db.session.execute(
+            query.order_by(BalanceCheckpoint.as_of.desc()).limit(1)
+        ).scalar()
+
+    @staticmethod
+    def create(interval_days=1, until=None):
+        """
+        Add checkpoints every interval_days after the newest one, up to until
+
+        Args:
+            interval_days (int): days between checkpoints
+            until (datetime, optional): last possible checkpoint, rounded down
+                to midnight, defaults to today so every checkpoint covers
+                finished days
+
+        Returns:
+            int: number of checkpoints added
+        """
+        until = datetime.combine((until or get_date()).date(), time.min)
+        step = timedelta(days=interval_days)
+        rows = []
+        for currency in CurrencyEnum:
+            previous = BalanceCheckpoint.latest(currency)
+            if previous is not None:
+                start, balance, count = (
+                    previous.as_of,
+                    previous.balance,
+                    previous.transaction_count,
+                )
+            else:
+                first = db.session.execute(
+                    select(func.min(Transaction.created_at)).where(
+                        Transaction.currency == currency.value
+                    )
+                ).scalar()
+                if first is None:
+                    continue
+                start, balance, count = datetime.combine(first.date(), time.min), 0.0, 0
+            if start + step > until:
+                continue
+
+            # running totals per day, computed by the database
+            day = func.date(Transaction.created_at)
+            daily = db.session.execute(
+                select(
+                    day.label("day"),
+                    func.sum(func.sum(Transaction.amount)).over(order_by=day),
+                    func.sum(func.count()).over(order_by=day),
+                )
+                .where(
+                    Transaction.currency == currency.value,
+                    Transaction.created_at >= start,
+                    Transaction.created_at < until,
+                )
+                .group_by(day)
+                .order_by(day)
+            ).all()
+
+            position, running_amount, running_count = 0, 0.0, 0
+            boundary = start + step
+            while boundary <= until:
+                # days are midnight aligned, take every day ending by the boundary
+                while position < len(daily) and (
+                    datetime.combine(date.fromisoformat(str(daily[position][0])), time.min)
+                    < boundary
+                ):
+                    running_amount, running_count = daily[position][1], daily[position][2]
+                    position += 1
+                rows.append(
+                    {
+                        "currency": currency.value,
+                        "as_of": boundary,
+                        "balance": balance + running_amount,
+                        "transaction_count": count + running_count,
+                    }
+                )
+                boundary += step
+        if rows:
+            db.session.execute(insert(BalanceCheckpoint), rows)
+        db.session.commit()
+        return len(rows)
+
+    @staticmethod
+    def rebuild(interval_days=1):
+        """Drop every checkpoint and recompute them from the transactions table"""
+        db.session.execute(delete(BalanceCheckpoint))
+        return BalanceCheckpoint.create(interval_days)
@@ -1,7 +1,17 @@
-from utils.utils import get_date
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from utils.cache import LRUCache
+from utils.db import upsert_insert
+from utils.utils import get_date, normalize_name
 from app import db
 from models.basemodel import BaseModel
 
+# normalized name -> uid of committed contractors
+contractor_cache = LRUCache(maxsize=10000)
+PENDING_CACHE_KEY = "contractor_cache_pending"
+NAME_LENGTH = 120
+
 
 class Contractor(BaseModel):
 
@@ -9,12 +19,118 @@ class Contractor(BaseModel):
 
     # general
     uid = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(120), nullable=False, index=True)
+    name = db.Column(db.String(NAME_LENGTH), nullable=False, index=True)
+    # lookup key for get_or_create, see utils.normalize_name. casefold() turns
+    # some characters into up to three ("ß" -> "ss", "ﬃ" -> "ffi")
+    name_normalized = db.Column(db.String(3 * NAME_LENGTH), nullable=True, unique=True)
 
     def __init__(self, name=None, **kwargs):
         super().__init__(**kwargs)
         self.name = name
+        if name is not None:
+            self.name_normalized = normalize_name(name)
 
     @staticmethod
     def find_by_name(name):
         return Contractor.query.filter(Contractor.name == name).first()
+
+    @staticmethod
+    def get_or_create(name):
+        """
+        Uid of the contractor with this name, creating it if needed
+
+        Repeat names are answered from contractor_cache without a query,
+        otherwise a single INSERT ... ON CONFLICT DO UPDATE ... RETURNING both
+        creates and looks up the contractor, so concurrent callers can not
+        create duplicates.
+
+        Args:
+            name (str): Contractor name
+
+        Returns:
+            int: uid of the contractor
+        """
+        return Contractor.get_or_create_many([name])[name]
+
+    @staticmethod
+    def get_or_create_many(names):
+        """
+        Set based get_or_create
+
+        Args:
+            names (iterable): Contractor names
+
+        Returns:
+            dict: name -> uid
+        """
+        from services.contractor_index import contractor_index
+
+        uids = {}
+        missing = {}
+        for name in set(names):
+            key = normalize_name(name)
+            uid = contractor_cache.get(key)
+            if uid is None:
+                # the first spelling of a normalized name becomes the display name
+                missing.setdefault(key, name)
+            else:
+                uids[key] = uid
+
+        if missing:
+            now = get_date()
+            stmt = upsert_insert(Contractor)
+            if hasattr(stmt, "on_conflict_do_update"):
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["name_normalized"],
+                    set_={"name_normalized": stmt.excluded.name_normalized},
+                ).returning(Contractor.uid, Contractor.name_normalized)
+                created = db.session.execute(
+                    stmt,
+                    [
+                        {
+                            "name": name,
+                            "name_normalized": key,
+                            "created_at": now,
+                            "updated_at": now,
+                        }
+                        for key, name in missing.items()
+                    ],
+                ).all()
+            else:
+                created = Contractor._select_or_insert(missing, now)
+            pending = db.session.info.setdefault(PENDING_CACHE_KEY, {})
+            for uid, key in created:
+                uids[key] = uid
+                pending[key] = uid
+            contractor_index.mark_stale()
+
+        return {name: uids[normalize_name(name)] for name in names}
+
+    @staticmethod
+    def _select_or_insert(missing, now):
+        """get_or_create_many for databases without ON CONFLICT"""
+        found = db.session.execute(
+            select(Contractor.uid, Contractor.name_normalized).where(
+                Contractor.name_normalized.in_(missing)
+            )
+        ).all()
+        known = {key for _, key in found}
+        contractors = [
+            Contractor(name=name, created_at=now, updated_at=now)
+            for key, name in missing.items()
+            if key not in known
+        ]
+        db.session.add_all(contractors)
+        db.session.flush()
+        return found + [(c.uid, c.name_normalized) for c in contractors]
+
+
+@event.listens_for(Session, "after_commit")
+def _cache_committed_contractors(session):
+    """Only cache uids once the INSERT that may have created them is committed"""
+    contractor_cache.update(session.info.pop(PENDING_CACHE_KEY, {}).items())
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_contractors(session):
+    session.info.pop(PENDING_CACHE_KEY, None)
@@ -21,6 +21,10 @@ class TransactionStatus(enum.Enum):
     PAYED = "payed"
 
 
+# lifecycle of a transaction, it only moves forward but may skip a status
+STATUS_ORDER = (TransactionStatus.SENT, TransactionStatus.RECEIVED, TransactionStatus.PAYED)
+
+
 class MethodEnum(enum.Enum):
     """
     Method of payment for transaction
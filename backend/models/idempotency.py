@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+from sqlalchemy import delete, select
+
+from app import db
+from utils.utils import get_date
+
+
+class IdempotencyKey(db.Model):
+    """
+    Response of a request sent with an Idempotency-Key header
+
+    Written in the same commit as the rows the request created, so a retry
+    finds either both or neither. The unique constraint makes concurrent
+    retries on different workers collide instead of writing twice.
+    """
+
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_key"),
+    )
+
+    uid = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.uid"), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    # sha256 of the request body, a key reused for another body is an error
+    fingerprint = db.Column(db.String(64), nullable=False)
+    # no foreign key, a partitioned transactions table has no unique uid to
+    # reference, see services.partitions
+    transaction_id = db.Column(db.Integer, nullable=True)
+    status_code = db.Column(db.Integer, nullable=False)
+    response = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=get_date, index=True)
+
+    @staticmethod
+    def get(user_id, key):
+        return db.session.execute(
+            select(IdempotencyKey).where(
+                IdempotencyKey.user_id == user_id, IdempotencyKey.key == key
+            )
+        ).scalar()
+
+    @staticmethod
+    def sweep_expired(ttl_hours=24, batch_size=1000):
+        """
+        Delete keys older than ttl_hours, batch_size rows per statement and commit
+
+        Returns:
+            int: number of deleted keys
+
+        Raises:
+            ValueError: batch_size is below 1, the loop would never end
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        cutoff = get_date() - timedelta(hours=ttl_hours)
+        deleted = 0
+        while True:
+            uids = (
+                db.session.execute(
+                    select(IdempotencyKey.uid)
+                    .where(IdempotencyKey.created_at <= cutoff)
+                    .limit(batch_size)
+                )
+                .scalars()
+                .all()
+            )
+            if uids:
+                db.session.execute(
+                    delete(IdempotencyKey)
+                    .where(IdempotencyKey.uid.in_(uids))
+                    .execution_options(synchronize_session=False)
+                )
+                db.session.commit()
+                deleted += len(uids)
+            if len(uids) < batch_size:
+                return deleted
@@ -0,0 +1,182 @@
+from collections import defaultdict
+
+from sqlalchemy import delete, func, insert, literal_column, select
+
+from app import db
+from utils.db import upsert_insert
+from utils.utils import get_date
+from models.enums import CurrencyEnum, TransactionStatus
+from models.transactions import Transaction
+
+
+class TransactionRollup(db.Model):
+    """
+    Pre-aggregated transaction counts and amounts per
+    (contractor, status, currency, day), maintained alongside every write
+    """
+
+    __tablename__ = "transaction_rollups"
+
+    uid = db.Column(db.Integer, primary_key=True)
+    contractor_id = db.Column(
+        db.Integer, db.ForeignKey("contractors.uid"), nullable=True
+    )
+    status = db.Column(
+        db.Enum(TransactionStatus, values_callable=lambda obj: [e.value for e in obj]),
+        nullable=False,
+    )
+    currency = db.Column(
+        db.Enum(CurrencyEnum, values_callable=lambda obj: [e.value for e in obj]),
+        nullable=False,
+    )
+    day = db.Column(db.Date, nullable=False, index=True)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(db.Float, nullable=False, default=0)
+
+    # NULLs never conflict in a unique key, so transactions without a
+    # contractor are grouped under 0, which no contractor uid takes
+    GROUP_COLUMNS = (
+        func.coalesce(contractor_id, literal_column("0")),
+        status,
+        currency,
+        day,
+    )
+    __table_args__ = (
+        db.Index("uq_transaction_rollups_group", *GROUP_COLUMNS, unique=True),
+    )
+
+    @staticmethod
+    def group_key(transaction, status=None):
+        """Rollup group of a transaction, optionally with a different status"""
+        status = status or transaction.status
+        currency = transaction.currency
+        created_at = transaction.created_at or get_date()
+        return (
+            transaction.contractor_id,
+            getattr(status, "value", status),
+            getattr(currency, "value", currency),
+            created_at.date(),
+        )
+
+    @staticmethod
+    def apply(deltas):
+        """
+        Add count and amount deltas to their rollup groups in the current session
+
+        Args:
+            deltas (dict): group_key -> (count delta, amount delta)
+        """
+        rows = [
+            {
+                "contractor_id": contractor_id,
+                "status": status,
+                "currency": currency,
+                "day": day,
+                "transaction_count": count,
+                "total_amount": amount,
+            }
+            for (contractor_id, status, currency, day), (count, amount) in deltas.items()
+            if count or amount
+        ]
+        if not rows:
+            return
+        stmt = upsert_insert(TransactionRollup)
+        if not hasattr(stmt, "on_conflict_do_update"):
+            raise RuntimeError("Rollups need PostgreSQL or SQLite upserts")
+        table = TransactionRollup.__table__
+        stmt = stmt.on_conflict_do_update(
+            index_elements=TransactionRollup.GROUP_COLUMNS,
+            set_={
+                "transaction_count": table.c.transaction_count
+                + stmt.excluded.transaction_count,
+                "total_amount": table.c.total_amount + stmt.excluded.total_amount,
+            },
+        )
+        db.session.execute(stmt, rows)
+
+    @staticmethod
+    def record(*transactions):
+        """Count newly added transactions, call before the commit that adds them"""
+        deltas = defaultdict(lambda: [0, 0.0])
+        for transaction in transactions:
+            delta = deltas[TransactionRollup.group_key(transaction)]
+            delta[0] += 1
+            delta[1] += transaction.amount
+        TransactionRollup.apply(deltas)
+
+    @staticmethod
+    def move(transaction, old_status):
+        """Move a transaction from its old status group to its current one"""
+        old_key = TransactionRollup.group_key(transaction, old_status)
+        new_key = TransactionRollup.group_key(transaction)
+        if old_key == new_key:
+            return
+        TransactionRollup.apply(
+            {
+                old_key: (-1, -transaction.amount),
+                new_key: (1, transaction.amount),
+            }
+        )
+
+    @staticmethod
+    def rebuild():
+        """Recompute every rollup group from the transactions table"""
+        day = func.date(Transaction.created_at)
+        grouped = select(
+            Transaction.contractor_id,
+            Transaction.status,
+            Transaction.currency,
+            day,
+            func.count(),
+            func.sum(Transaction.amount),
+        ).group_by(
+            Transaction.contractor_id, Transaction.status, Transaction.currency, day
+        )
+        db.session.execute(delete(TransactionRollup))
+        db.session.execute(
+            insert(TransactionRollup).from_select(
+                [
+                    "contractor_id",
+                    "status",
+                    "currency",
+                    "day",
+                    "transaction_count",
+                    "total_amount",
+                ],
+                grouped,
+            )
+        )
+        db.session.commit()
+
+    @staticmethod
+    def summary(contractor_id=None, status=None, currency=None, day_from=None, day_to=None):
+        """
+        Totals per (contractor, status, currency) read straight from the rollups
+
+        Returns:
+            list: rows of contractor_id, status, currency, count and amount
+        """
+        query = select(
+            TransactionRollup.contractor_id,
+            TransactionRollup.status,
+            TransactionRollup.currency,
+            func.sum(TransactionRollup.transaction_count).label("transaction_count"),
+            func.sum(TransactionRollup.total_amount).label("total_amount"),
+        ).group_by(
+            TransactionRollup.contractor_id,
+            TransactionRollup.status,
+            TransactionRollup.currency,
+        )
+        # groups emptied by status changes keep a zero row until the next rebuild
+        query = query.having(func.sum(TransactionRollup.transaction_count) != 0)
+        if contractor_id is not None:
+            query = query.where(TransactionRollup.contractor_id == contractor_id)
+        if status is not None:
+            query = query.where(TransactionRollup.status == status.value)
+        if currency is not None:
+            query = query.where(TransactionRollup.currency == currency.value)
+        if day_from is not None:
+            query = query.where(TransactionRollup.day >= day_from)
+        if day_to is not None:
+            query = query.where(TransactionRollup.day <= day_to)
+        return db.session.execute(query).all()
@@ -1,13 +1,24 @@
 from flask import current_app, abort
+from sqlalchemy import delete, func, select
 from app import db
 import jwt
 from models.basemodel import BaseModel
 from datetime import datetime, timedelta
 import secrets
 from utils.utils import get_date
-import secrets
 import hashlib
+import hmac
+import time
+from collections import namedtuple
 from werkzeug.http import dump_cookie
+from utils.cache import LRUCache
+
+# user id -> current users.token_version, revocations in other processes
+# are seen once the entry expires
+token_versions = LRUCache(maxsize=10000, ttl=30)
+
+# what an access token says about its user, returned by verify_access_token
+AccessTokenUser = namedtuple("AccessTokenUser", "uid username is_verified token_version")
 
 
 class Token(BaseModel):
@@ -15,7 +26,7 @@ class Token(BaseModel):
 
     uid = db.Column(db.Integer, primary_key=True)
     refresh_token = db.Column(db.String(64), nullable=False, index=True, unique=True)
-    refresh_expiration = db.Column(db.DateTime, nullable=False)
+    refresh_expiration = db.Column(db.DateTime, nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.uid"), index=True)
 
     user = db.relationship("User", backref="tokens")
@@ -28,14 +39,35 @@ class Token(BaseModel):
     def generate_tokens():
         """Generate  tokens"""
 
-        # Step 1: generate raw random token
-        refresh_token_raw = secrets.token_urlsafe(32)
+        # Step 1: generate raw random token, prefixed with its issue time in hex
+        # and signed, so the refresh token filter knows whether it can vouch for it
+        body = f"{int(time.time()):x}.{secrets.token_urlsafe(32)}"
+        refresh_token_raw = f"{body}.{Token._issue_signature(body)}"
 
         # Step 2: hash it for DB storage (SHA-256)
         refresh_token_hash = hashlib.sha256(refresh_token_raw.encode()).hexdigest()
 
         return refresh_token_raw, refresh_token_hash
 
+    @staticmethod
+    def _issue_signature(body):
+        key = current_app.config["SECRET_KEY"].encode()
+        return hmac.new(key, body.encode(), hashlib.sha256).hexdigest()[:32]
+
+    @staticmethod
+    def issued_at(refresh_token_raw):
+        """
+        Issue time of a raw refresh token, None for tokens without one or
+        whose signature does not match, as the client could pick any time
+        """
+        body, dot, signature = refresh_token_raw.rpartition(".")
+        if not dot or not hmac.compare_digest(signature, Token._issue_signature(body)):
+            return None
+        try:
+            return int(body.partition(".")[0], 16)
+        except ValueError:
+            return None
+
     def set_refresh_token_date(self, refresh_days=30):
         now = get_date()
         self.refresh_expiration = now + timedelta(days=refresh_days)
@@ -47,16 +79,95 @@ class Token(BaseModel):
         Get token object by refresh token hash, regardless of expiration.
         Returns the token object if found, None if not found.
         """
+        from services.token_filter import refresh_token_filter
+
         candidate_hash = hashlib.sha256(candidate_token.encode()).hexdigest()
+        if current_app.config.get("TOKEN_FILTER_ENABLED", True):
+            if not refresh_token_filter.might_exist(
+                candidate_token,
+                candidate_hash,
+                current_app.config.get("TOKEN_FILTER_REBUILD_SECONDS", 300),
+            ):
+                return None
         return Token.query.filter(Token.refresh_token == candidate_hash).first()
 
+    @staticmethod
+    def sweep_expired(batch_size=1000):
+        """
+        Delete expired tokens, batch_size rows per statement and commit
+
+        Returns:
+            int: number of deleted tokens
+
+        Raises:
+            ValueError: batch_size is below 1, the loop would never end
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        deleted = 0
+        while True:
+            uids = (
+                db.session.execute(
+                    select(Token.uid)
+                    .where(Token.refresh_expiration <= get_date())
+                    .limit(batch_size)
+                )
+                .scalars()
+                .all()
+            )
+            if uids:
+                db.session.execute(
+                    delete(Token)
+                    .where(Token.uid.in_(uids))
+                    .execution_options(synchronize_session=False)
+                )
+                db.session.commit()
+                deleted += len(uids)
+            if len(uids) < batch_size:
+                return deleted
+
+    @staticmethod
+    def trim_sessions(max_sessions, user_id=None):
+        """
+        Delete all but the max_sessions newest tokens of every user, or only of user_id
+
+        Returns:
+            int: number of deleted tokens
+        """
+        ranked = select(
+            Token.uid,
+            func.row_number()
+            .over(
+                partition_by=Token.user_id,
+                order_by=(Token.refresh_expiration.desc(), Token.uid.desc()),
+            )
+            .label("position"),
+        )
+        if user_id is not None:
+            ranked = ranked.where(Token.user_id == user_id)
+        ranked = ranked.subquery()
+        result = db.session.execute(
+            delete(Token)
+            .where(
+                Token.uid.in_(select(ranked.c.uid).where(ranked.c.position > max_sessions))
+            )
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount
+
     def get_access_jwt(self):
-        """Generate JWT for access token"""
+        """Generate JWT for access token, carrying a snapshot of its user"""
+        from models.user import User
+
         try:
-            print("secret_ley", current_app.config["SECRET_KEY"])
+            user = self.user or db.session.get(User, self.user_id)
             return jwt.encode(
                 {
                     "token": secrets.token_urlsafe(),
+                    "user_id": user.uid,
+                    "username": user.username,
+                    "is_verified": user.is_verified,
+                    "ver": user.token_version,
                     "exp": (get_date() + timedelta(minutes=15)).timestamp(),
                 },
                 current_app.config["SECRET_KEY"],
@@ -103,20 +214,67 @@ class Token(BaseModel):
         )
 
     @classmethod
-    def verify_access_token(cls, access_token):
-        from models.user import User
-
-        token = Token.decode_access_token(access_token)
-        if not token:
+    def access_token_claims(cls, access_token):
+        """
+        Returns:
+            dict: payload of a valid, unexpired access token with a user
+                snapshot, None otherwise
+        """
+        try:
+            claims = cls.decode_access_token(access_token)
+        except jwt.PyJWTError:
             return None
+        if not claims.get("user_id") or "ver" not in claims:
+            return None
+        return claims
 
-        if not token["user_id"]:
+    @staticmethod
+    def cached_token_version(claims):
+        """
+        Returns:
+            int | None: cached token version of the user, None when it has to
+                be read from the database
+        """
+        version = token_versions.get(claims["user_id"])
+        # a newer token than the cache means the cache missed a revocation
+        if version is None or claims["ver"] > version:
             return None
-        if not (token["exp"] > datetime.utcnow()):
+        return version
+
+    @staticmethod
+    def token_user(claims, version):
+        """The user snapshot of claims, None when its version was revoked"""
+        if version is None or claims["ver"] != version:
             return None
-        user = User.get_user_by_id(token["user_id"])
+        return AccessTokenUser(
+            claims["user_id"], claims["username"], claims["is_verified"], version
+        )
+
+    @classmethod
+    def verify_access_token(cls, access_token):
+        """
+        Trust the user snapshot of an access token until it expires, reading
+        the user's token version only when it is not cached
 
-        return user
+        Returns:
+            AccessTokenUser | None: the user the token was issued to
+        """
+        from models.user import User
+
+        claims = cls.access_token_claims(access_token)
+        if claims is None:
+            return None
+        version = cls.cached_token_version(claims)
+        if version is None:
+            # a replica could still have the version from before a revocation
+            version = db.session.execute(
+                select(User.token_version)
+                .where(User.uid == claims["user_id"])
+                .execution_options(use_primary=True)
+            ).scalar()
+            if version is not None:
+                token_versions.set(claims["user_id"], version)
+        return cls.token_user(claims, version)
 
     @classmethod
     def find_by_refresh_token(cls, refresh_token):
@@ -139,7 +297,6 @@ class Token(BaseModel):
             domain=domain,
         )
         access_token = token_db.get_access_jwt()
-        print("access_token", access_token)
         return (
             {
                 "access_token": access_token,
@@ -1,12 +1,38 @@
 import enum
+import hashlib
+import uuid
 from flask import abort
+from sqlalchemy import select, update
 from sqlalchemy.orm import validates
 
 from app import db
 from utils.utils import get_date
-from models.enums import CurrencyEnum, TransactionStatus, MethodEnum
+from models.enums import CurrencyEnum, TransactionStatus, MethodEnum, STATUS_ORDER
 from models.basemodel import BaseModel
 
+# statuses a transaction may move to from each status, payed is final
+STATUS_TRANSITIONS = {
+    status: STATUS_ORDER[index + 1 :] for index, status in enumerate(STATUS_ORDER)
+}
+STATUS_TIMESTAMPS = {
+    TransactionStatus.SENT: "sent_at",
+    TransactionStatus.RECEIVED: "received_at",
+    TransactionStatus.PAYED: "payed_at",
+}
+
+
+class TransitionError(ValueError):
+    """
+    Raised when some transactions can not move to the requested status
+
+    Args:
+        rejected (list): (uid, current status or None when missing) pairs
+    """
+
+    def __init__(self, rejected):
+        super().__init__(f"{len(rejected)} transaction(s) can not make this transition")
+        self.rejected = rejected
+
 
 class Transaction(BaseModel):  # type:ignore
     """
@@ -14,13 +40,34 @@ class Transaction(BaseModel):  # type:ignore
     """
 
     __tablename__ = "transactions"
+    # one index per filter + sort shape of get_transactions, ending in uid like
+    # its ORDER BY so pages and cursors are index range scans. They also cover
+    # the plain status, contractor_id and method lookups.
+    __table_args__ = (
+        db.Index("ix_transactions_created_at_uid", "created_at", "uid"),
+        db.Index("ix_transactions_amount_uid", "amount", "uid"),
+        db.Index("ix_transactions_status_created_at_uid", "status", "created_at", "uid"),
+        db.Index("ix_transactions_status_amount_uid", "status", "amount", "uid"),
+        db.Index(
+            "ix_transactions_contractor_id_created_at_uid",
+            "contractor_id",
+            "created_at",
+            "uid",
+        ),
+        db.Index("ix_transactions_contractor_id_amount_uid", "contractor_id", "amount", "uid"),
+        db.Index("ix_transactions_method_created_at_uid", "method", "created_at", "uid"),
+        # running balances and as-of sums per currency
+        db.Index(
+            "ix_transactions_currency_created_at_uid", "currency", "created_at", "uid"
+        ),
+    )
+
     uid = db.Column(db.Integer, primary_key=True)
     status = db.Column(
         db.Enum(TransactionStatus, values_callable=lambda obj: [e.value for e in obj]),
         nullable=False,
         default=TransactionStatus.SENT.value,
         server_default=TransactionStatus.SENT.value,
-        index=True,
     )
     sent_at = db.Column(db.DateTime, nullable=True, index=True)
     payed_at = db.Column(db.DateTime, nullable=True, index=True)
@@ -38,21 +85,107 @@ class Transaction(BaseModel):  # type:ignore
         nullable=False,
         default=MethodEnum.TRANSACTION.value,
         server_default=MethodEnum.TRANSACTION.value,
-        index=True,
     )
     # This is the payment intent ID
-    tracking_id = db.Column(db.String(256), nullable=True)
-    contractor_id = db.Column(db.Integer, db.ForeignKey("contractors.uid"), index=True)
+    tracking_id = db.Column(db.String(256), nullable=True, index=True)
+    contractor_id = db.Column(db.Integer, db.ForeignKey("contractors.uid"))
     # One Contractor to Many transactions relation
     contractor = db.relationship("Contractor", backref="transactions")
 
+    @staticmethod
+    def generate_tracking_id(contractor_uid, amount):
+        """Generate a unique tracking id for a new transaction"""
+        unique_string = (
+            f"{contractor_uid}_{amount}_{get_date().isoformat()}_{uuid.uuid4()}"
+        )
+        return hashlib.sha256(unique_string.encode()).hexdigest()
+
     @staticmethod
     def get_transaction_by_id(id):
         return Transaction.query.get(id)
 
+    @staticmethod
+    def bulk_transition(status, uids=None, where=None):
+        """
+        Move transactions to status with one UPDATE ... RETURNING per allowed
+        source status, stamping the matching *_at column and moving rollups
+
+        With uids every listed transaction has to be able to make the
+        transition, otherwise nothing is changed. Rows selected by where that
+        can not make it are left alone, as if the filter excluded them.
+        Does not commit, roll back after a TransitionError.
+
+        Args:
+            status (TransactionStatus): target status
+            uids (list, optional): transaction ids
+            where (Select, optional): select of transaction uids
+
+        Returns:
+            list: uids of the moved transactions
+
+        Raises:
+            TransitionError: Some of uids are missing or in a status that can
+                not move to status
+        """
+        from models.rollups import TransactionRollup
+
+        if uids is not None:
+            uids = list(set(uids))
+            matched = Transaction.uid.in_(uids)
+        else:
+            matched = Transaction.uid.in_(where)
+        now = get_date()
+        moved, deltas = [], {}
+        sources = [old for old, targets in STATUS_TRANSITIONS.items() if status in targets]
+        for old_status in sources:
+            rows = db.session.execute(
+                update(Transaction)
+                .where(matched, Transaction.status == old_status.value)
+                .values(
+                    {
+                        "status": status.value,
+                        STATUS_TIMESTAMPS[status]: now,
+                        "updated_at": now,
+                    }
+                )
+                .returning(
+                    Transaction.uid,
+                    Transaction.contractor_id,
+                    Transaction.currency,
+                    Transaction.created_at,
+                    Transaction.amount,
+                )
+                .execution_options(synchronize_session=False)
+            ).all()
+            for row in rows:
+                moved.append(row.uid)
+                for key, sign in (
+                    (TransactionRollup.group_key(row, old_status), -1),
+                    (TransactionRollup.group_key(row, status), 1),
+                ):
+                    count, amount = deltas.get(key, (0, 0.0))
+                    deltas[key] = (count + sign, amount + sign * row.amount)
+
+        if uids is not None and len(moved) != len(uids):
+            missing = set(uids).difference(moved)
+            found = dict(
+                db.session.execute(
+                    select(Transaction.uid, Transaction.status).where(
+                        Transaction.uid.in_(missing)
+                    )
+                ).all()
+            )
+            raise TransitionError(
+                [(uid, found.get(uid)) for uid in sorted(missing)]
+            )
+        TransactionRollup.apply(deltas)
+        return moved
+
     def update(self, **kwargs):
+        from models.rollups import TransactionRollup
+
         status = kwargs["status"]
-        print("test")
+        old_status = self.status
         match status:
             case "sent":
                 self.sent_at = get_date()
@@ -60,4 +193,6 @@ class Transaction(BaseModel):  # type:ignore
                 self.payed_at = get_date()
             case "received":
                 self.received_at = get_date()
-        super().update(commit=True, **kwargs)
+        super().update(commit=False, **kwargs)
+        TransactionRollup.move(self, old_status)
+        super().update(commit=True)
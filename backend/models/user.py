@@ -1,11 +1,11 @@
 from flask import current_app, request, abort, render_template
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 from time import time
 from sqlalchemy.orm import validates
 from app import db
-from models.token import Token
+from models.token import Token, token_versions
 from services.email import send_email
+from services.passwords import check_password, hash_password
 from utils.utils import get_date
 
 from models.basemodel import BaseModel
@@ -24,6 +24,8 @@ class User(BaseModel):
         db.Boolean,
         default=False,
     )
+    # part of every access token, bumping it revokes all of them
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
     @property
     def password(self):
@@ -31,7 +33,7 @@ class User(BaseModel):
 
     @password.setter
     def password(self, password):  # Hashes the password
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     @validates("email")
     def validate_email(self, key, email):
@@ -52,7 +54,14 @@ class User(BaseModel):
         return username
 
     def verify_password(self, password: str):  # Verifies the hashed password
-        return check_password_hash(self.password_hash, password)
+        return check_password(self.password_hash, password)
+
+    def revoke_tokens(self):
+        """Invalidate every access and refresh token issued to the user"""
+        self.token_version = (self.token_version or 0) + 1
+        Token.query.filter(Token.user_id == self.uid).delete(synchronize_session=False)
+        db.session.commit()
+        token_versions.set(self.uid, self.token_version)
 
     @staticmethod
     def get_user_by_username(username: str):
@@ -1,5 +1,9 @@
-from app import create_app
+from dotenv import load_dotenv
+
+# before config.py reads the environment
+load_dotenv()
+
+from app import create_app  # noqa: E402
 from decouple import config
 
-print('TEST RUN ')
 app = create_app(config("CONFIG_NAME"))
@@ -6,3 +6,5 @@ class ContractorSchema(SQLAlchemyAutoSchema):
     class Meta:
         model = Contractor
         load_instance = True
+        # internal lookup key, see Contractor.get_or_create
+        exclude = ("name_normalized",)
@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from app import ma
 
 from marshmallow import fields
@@ -11,6 +13,22 @@ class UpdateTransactionSchema(ma.Schema):
     status = ma.String(required=False)
 
 
+class QueryParameter(fields.String):
+    """Text of a query parameter sent in a JSON body, numbers are taken as their text"""
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)
+        return super()._deserialize(value, attr, data, **kwargs)
+
+
+class BulkTransitionSchema(ma.Schema):
+    status = ma.String(required=True)
+    transaction_ids = fields.List(fields.Integer(), required=False)
+    # same keys as the get_transactions query parameters
+    filter = fields.Dict(keys=fields.String(), values=QueryParameter(), required=False)
+
+
 class AddTransactionSchema(ma.Schema):
     currency = ma.String(required=False)
     contractor_id = ma.Integer(required=False)
@@ -48,4 +66,70 @@ class TransactionSchema(SQLAlchemyAutoSchema):
     contractor_id = auto_field()
     status = fields.Function(lambda obj: obj.status.value)
     currency = fields.Function(lambda obj: obj.currency.value)
-    method = fields.Function(lambda obj: obj.method.value)
\ No newline at end of file
+    method = fields.Function(lambda obj: obj.method.value)
+
+
+# Columns read by the row serializer below, in the order of dump_transaction_row
+TRANSACTION_ROW_COLUMNS = (
+    Transaction.uid,
+    Transaction.created_at,
+    Transaction.updated_at,
+    Transaction.status,
+    Transaction.sent_at,
+    Transaction.payed_at,
+    Transaction.received_at,
+    Transaction.currency,
+    Transaction.amount,
+    Transaction.method,
+    Transaction.tracking_id,
+    Transaction.contractor_id,
+    Contractor.uid.label("contractor_uid"),
+    Contractor.name.label("contractor_name"),
+)
+
+
+def _iso(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def dump_transaction_row(row):
+    """
+    Serialize a row of TRANSACTION_ROW_COLUMNS exactly like TransactionSchema
+    serializes the Transaction, without building ORM objects or marshmallow
+    fields. TransactionSchema stays the reference for the output format.
+    """
+    (
+        uid,
+        created_at,
+        updated_at,
+        status,
+        sent_at,
+        payed_at,
+        received_at,
+        currency,
+        amount,
+        method,
+        tracking_id,
+        contractor_id,
+        contractor_uid,
+        contractor_name,
+    ) = row
+    return {
+        "amount": amount,
+        "contractor": (
+            None
+            if contractor_uid is None
+            else {"name": contractor_name, "uid": contractor_uid}
+        ),
+        "contractor_id": contractor_id,
+        "created_at": _iso(created_at),
+        "currency": currency.value,
+        "method": method.value,
+        "payed_at": _iso(payed_at),
+        "received_at": _iso(received_at),
+        "sent_at": _iso(sent_at),
+        "status": status.value,
+        "tracking_id": tracking_id,
+        "uid": uid,
+        "updated_at": _iso(updated_at),
+    }
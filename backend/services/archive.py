@@ -0,0 +1,170 @@
+import csv
+import gzip
+import os
+from datetime import datetime
+
+from sqlalchemy import text
+
+from services.export import EXPORT_FIELDS, export_value
+from services.partitions import PARENT, partition_name, partition_month
+from services.transactions import DATE_RANGES, TransactionQueryError
+
+ARCHIVE_SUFFIX = ".csv.gz"
+INTEGER_FIELDS = ("uid", "contractor_id")
+
+
+def archive_path(directory, month):
+    return os.path.join(directory, partition_name(month) + ARCHIVE_SUFFIX)
+
+
+def archived_months(directory):
+    """Months with an archive file in directory, oldest first"""
+    if not os.path.isdir(directory):
+        return []
+    months = (
+        partition_month(name[: -len(ARCHIVE_SUFFIX)])
+        for name in os.listdir(directory)
+        if name.endswith(ARCHIVE_SUFFIX)
+    )
+    return sorted(month for month in months if month)
+
+
+def parse_archive_months(value, directory):
+    """
+    Parse the archive query parameter, comma separated YYYY-MM or "all"
+
+    Raises:
+        TransactionQueryError: a month is malformed or has no archive
+    """
+    available = archived_months(directory)
+    if value == "all":
+        return available
+    months = []
+    for part in value.split(","):
+        try:
+            month = datetime.strptime(part.strip(), "%Y-%m").date()
+        except ValueError:
+            raise TransactionQueryError("archive must be YYYY-MM months or all")
+        if month not in available:
+            raise TransactionQueryError(f"No archive for {part.strip()}")
+        months.append(month)
+    return sorted(set(months))
+
+
+def _dump(connection, table, path, batch_size):
+    """Write table to path, verified against its row count, returns the count"""
+    columns = ", ".join(f"t.{field}" for field in EXPORT_FIELDS if field != "contractor_name")
+    result = connection.execution_options(yield_per=batch_size).execute(
+        text(
+            f"SELECT {columns}, c.name AS contractor_name FROM {table} t "
+            "LEFT JOIN contractors c ON c.uid = t.contractor_id "
+            "ORDER BY t.created_at, t.uid"
+        )
+    )
+    partial = path + ".partial"
+    written = 0
+    with gzip.open(partial, "wt", newline="") as archive:
+        writer = csv.writer(archive)
+        writer.writerow(EXPORT_FIELDS)
+        for batch in result.partitions():
+            writer.writerows([export_value(value) for value in row] for row in batch)
+            written += len(batch)
+
+    expected = connection.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+    if written != expected:
+        os.remove(partial)
+        raise RuntimeError(f"{table}: wrote {written} of {expected} rows")
+    os.replace(partial, path)
+    return written
+
+
+def archive_partition(engine, month, directory, batch_size=1000, lock_timeout="5s"):
+    """
+    Write the partition of month to a gzipped CSV in the export layout, then
+    detach and drop it
+
+    The dump reads the still attached partition in one REPEATABLE READ
+    snapshot, which only takes the lock any SELECT takes. The parent is
+    locked just for the DETACH and the DROP, each its own short transaction
+    giving up after lock_timeout. DETACH ... CONCURRENTLY can not be used
+    while the default partition exists. Rows added to the month during the
+    dump are caught by counting again once it is detached, and the file is
+    then rewritten from the detached table.
+
+    Returns:
+        int: number of archived transactions
+    """
+    name = partition_name(month)
+    os.makedirs(directory, exist_ok=True)
+    path = archive_path(directory, month)
+    with engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="REPEATABLE READ")
+        written = _dump(connection, name, path, batch_size)
+        connection.rollback()
+
+    with engine.begin() as connection:
+        connection.execute(text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+        connection.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+
+    # the detached table no longer receives writes
+    with engine.connect() as connection:
+        if connection.execute(text(f"SELECT count(*) FROM {name}")).scalar() != written:
+            written = _dump(connection, name, path, batch_size)
+        connection.rollback()
+
+    with engine.begin() as connection:
+        connection.execute(text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+        connection.execute(text(f"DROP TABLE {name}"))
+    return written
+
+
+def _parse_row(row):
+    values = {field: value or None for field, value in zip(EXPORT_FIELDS, row)}
+    for field in INTEGER_FIELDS:
+        if values[field] is not None:
+            values[field] = int(values[field])
+    values["amount"] = float(values["amount"])
+    return values
+
+
+def _matches(values, filters):
+    if filters.get("contractor_id") and values["contractor_id"] != filters["contractor_id"]:
+        return False
+    for field in ("status", "method"):
+        if filters.get(field) and values[field] != filters[field].value:
+            return False
+    for name, (start, end) in (filters.get("date_ranges") or {}).items():
+        value = values[DATE_RANGES[name].key]
+        if value is None:
+            return False
+        value = datetime.fromisoformat(value)
+        if (start is not None and value < start) or (end is not None and value > end):
+            return False
+    if filters.get("amount_min") is not None and values["amount"] < filters["amount_min"]:
+        return False
+    if filters.get("amount_max") is not None and values["amount"] > filters["amount_max"]:
+        return False
+    return True
+
+
+def archive_batches(directory, months, filters, batch_size=1000):
+    """
+    Yield lists of export rows from the archives of months, oldest first
+
+    Applies the get_transactions filters except search, rows come in
+    created_at order whatever the requested sort.
+    """
+    batch = []
+    for month in months:
+        with gzip.open(archive_path(directory, month), "rt", newline="") as archive:
+            reader = csv.reader(archive)
+            next(reader)
+            for row in reader:
+                values = _parse_row(row)
+                if _matches(values, filters):
+                    batch.append([values[field] for field in EXPORT_FIELDS])
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,202 @@
+"""
+Asyncio serving mode for the polling heavy read endpoints
+
+GET get_transactions, get_transaction/<id> and get_contractors are answered
+from an AsyncEngine (asyncpg / aiosqlite), so one process keeps hundreds of
+reads in flight on a small pool instead of one per worker thread. The
+filters, select builders and serializers are the ones the Flask views use.
+Every other request is passed to the Flask app, see asgi.py.
+"""
+import re
+from urllib.parse import parse_qsl
+
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import Unauthorized
+
+from models.contractors import Contractor
+from models.token import Token, token_versions
+from models.transactions import Transaction
+from models.user import User
+from schema.contractors import ContractorSchema
+from schema.transactions import dump_transaction_row
+from services.search import search_backend
+from services.transactions import (
+    TransactionQueryError,
+    build_transactions_select,
+    paginate_cursor,
+    paginate_offset,
+    parse_transaction_filters,
+    transaction_rows_select,
+)
+from utils.serialization import dumps
+
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+READ_METHODS = ("GET", "HEAD")
+
+
+def async_database_uri(uri):
+    """
+    Same database as uri, with the async driver of its dialect
+
+    Raises:
+        ValueError: The dialect has no supported async driver
+    """
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver for {backend} databases")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+
+class AuthError(Exception):
+    """The request has no valid access token"""
+
+
+async def current_user(session, app, headers):
+    """Async twin of auth.verify_token"""
+    if app.config.get("DISABLE_AUTH", True):
+        user = await session.get(User, 1)
+    else:
+        scheme, _, access_token = headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not access_token:
+            raise AuthError()
+        claims = Token.access_token_claims(access_token)
+        if claims is None:
+            raise AuthError()
+        version = Token.cached_token_version(claims)
+        if version is None:
+            result = await session.execute(
+                select(User.token_version).where(User.uid == claims["user_id"])
+            )
+            version = result.scalar()
+            if version is not None:
+                token_versions.set(claims["user_id"], version)
+        user = Token.token_user(claims, version)
+    if user is None:
+        raise AuthError()
+    return user
+
+
+async def get_transactions(session, args):
+    filters = parse_transaction_filters(args)
+    stmt = build_transactions_select(filters)
+    paginate = paginate_cursor if filters["cursor"] is not None else paginate_offset
+    rows, pagination = await session.run_sync(
+        lambda sync_session: paginate(stmt, filters, sync_session)
+    )
+    return 200, {
+        "transactions": [dump_transaction_row(row) for row in rows],
+        "pagination": pagination,
+    }
+
+
+async def get_transaction(session, args, id):
+    result = await session.execute(transaction_rows_select().where(Transaction.uid == id))
+    row = result.first()
+    if row is None:
+        return 404, {"error": "No transaction found"}
+    return 200, dump_transaction_row(row)
+
+
+async def get_contractors(session, args):
+    result = await session.execute(select(Contractor))
+    return 200, ContractorSchema(many=True).dump(result.scalars().all())
+
+
+# path -> (handler(session, args, *path_args), whether it needs @authenticate(token_auth))
+ROUTES = (
+    (re.compile(r"/api/get_transactions"), get_transactions, False),
+    (re.compile(r"/api/get_transaction/(\d+)"), get_transaction, True),
+    (re.compile(r"/api/get_contractors"), get_contractors, True),
+)
+
+
+class AsyncReadApp:
+    """ASGI app serving ROUTES itself and everything else through the Flask app"""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.fallback = WsgiToAsgi(flask_app)
+        config = flask_app.config
+        self.engine = create_async_engine(
+            async_database_uri(config["SQLALCHEMY_DATABASE_URI"]),
+            pool_size=config.get("ASYNC_POOL_SIZE", 20),
+            max_overflow=config.get("ASYNC_MAX_OVERFLOW", 10),
+            pool_pre_ping=True,
+        )
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] == "http" and scope["method"] in READ_METHODS:
+            for pattern, handler, needs_user in ROUTES:
+                match = pattern.fullmatch(scope["path"])
+                if match:
+                    status, payload = await self.dispatch(
+                        scope, handler, needs_user, match.groups()
+                    )
+                    return await self.respond(scope, send, status, payload)
+        await self.fallback(scope, receive, send)
+
+    async def dispatch(self, scope, handler, needs_user, path_args):
+        headers = {
+            key.decode("latin-1").lower(): value.decode("latin-1")
+            for key, value in scope["headers"]
+        }
+        # contexts live in contextvars, so each request task gets its own
+        with self.flask_app.app_context():
+            try:
+                async with self.sessions() as session:
+                    if needs_user:
+                        await current_user(session, self.flask_app, headers)
+                    query = scope["query_string"].decode("latin-1")
+                    args = MultiDict(parse_qsl(query, keep_blank_values=True))
+                    return await handler(session, args, *(int(arg) for arg in path_args))
+            except AuthError:
+                error = Unauthorized()
+                return error.code, {
+                    "code": error.code,
+                    "message": error.name,
+                    "description": error.description,
+                }
+            except TransactionQueryError as e:
+                return 400, {"error": str(e)}
+            except Exception as e:
+                return 500, {"error": f"Internal server error: {str(e)}"}
+
+    async def respond(self, scope, send, status, payload):
+        body = dumps(payload)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+        )
+        await send(
+            {
+                "type": "http.response.body",
+                "body": b"" if scope["method"] == "HEAD" else body,
+            }
+        )
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # the first search_backend() call blocks, later checks run in a thread
+                with self.flask_app.app_context():
+                    search_backend()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
@@ -0,0 +1,90 @@
+from sqlalchemy import func, literal, select, tuple_
+
+from app import db
+from models.balances import BalanceCheckpoint
+from models.transactions import Transaction
+from schema.transactions import dump_transaction_row
+from services.transactions import transaction_rows_select
+
+
+def balance_as_of(currency, moment):
+    """
+    Balance of currency over every transaction created at or before moment
+
+    Only the transactions since the newest checkpoint before moment are summed.
+
+    Returns:
+        tuple: (balance, transaction count, checkpoint used or None)
+    """
+    checkpoint = BalanceCheckpoint.latest(currency, moment)
+    query = select(func.coalesce(func.sum(Transaction.amount), 0.0), func.count()).where(
+        Transaction.currency == currency.value, Transaction.created_at <= moment
+    )
+    balance, count = 0.0, 0
+    if checkpoint is not None:
+        query = query.where(Transaction.created_at >= checkpoint.as_of)
+        balance, count = checkpoint.balance, checkpoint.transaction_count
+    amount, rows = db.session.execute(query).one()
+    return balance + amount, count + rows, checkpoint
+
+
+def running_balance_page(currency, page=1, per_page=20, moment=None):
+    """
+    Newest first page of transactions of currency, each with the balance
+    right after it
+
+    The running sum is a window function over the rows between the nearest
+    checkpoint before the page and its newest row.
+
+    Returns:
+        tuple: (serialized transactions, pagination dict, checkpoint used or None)
+    """
+    query = transaction_rows_select().where(Transaction.currency == currency.value)
+    if moment is not None:
+        query = query.where(Transaction.created_at <= moment)
+    rows = db.session.execute(
+        query.order_by(Transaction.created_at.desc(), Transaction.uid.desc())
+        .limit(per_page + 1)
+        .offset((page - 1) * per_page)
+    ).all()
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    pagination = {
+        "page": page,
+        "per_page": per_page,
+        "has_prev": page > 1,
+        "has_next": has_next,
+    }
+    if not rows:
+        return [], pagination, None
+
+    newest, oldest = rows[0], rows[-1]
+    checkpoint = BalanceCheckpoint.latest(currency, oldest.created_at)
+    base = checkpoint.balance if checkpoint is not None else 0.0
+    window = select(
+        Transaction.uid,
+        func.sum(Transaction.amount)
+        .over(order_by=(Transaction.created_at, Transaction.uid))
+        .label("running_balance"),
+    ).where(
+        Transaction.currency == currency.value,
+        tuple_(Transaction.created_at, Transaction.uid)
+        <= tuple_(literal(newest.created_at, Transaction.created_at.type), literal(newest.uid)),
+    )
+    if checkpoint is not None:
+        window = window.where(Transaction.created_at >= checkpoint.as_of)
+    window = window.subquery()
+    running = dict(
+        db.session.execute(
+            select(window.c.uid, window.c.running_balance).where(
+                window.c.uid.in_([row.uid for row in rows])
+            )
+        ).all()
+    )
+
+    transactions = []
+    for row in rows:
+        item = dump_transaction_row(row)
+        item["running_balance"] = base + running[row.uid]
+        transactions.append(item)
+    return transactions, pagination, checkpoint
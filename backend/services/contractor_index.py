@@ -0,0 +1,88 @@
+import threading
+import time
+from bisect import bisect_left
+
+from sqlalchemy import select
+
+from app import db
+from models.contractors import Contractor
+from utils.utils import normalize_name
+
+
+class ContractorPrefixIndex:
+    """
+    Sorted in-memory list of (normalized name, uid, name) answering prefix
+    queries with two binary searches
+
+    Contractors are never deleted, so the index only has to pick up new uids.
+    It does so incrementally when it is older than the refresh interval or
+    after mark_stale is called by code that creates contractors. A periodic
+    full reload catches uids committed out of order by concurrent writers.
+    """
+
+    full_reload_interval = 300
+
+    def __init__(self):
+        self._entries = []
+        self._max_uid = 0
+        self._refreshed_at = None
+        self._reloaded_at = None
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def mark_stale(self):
+        self._stale = True
+
+    def refresh(self, refresh_interval=5):
+        """Load contractors added since the last refresh when the index is stale"""
+        now = time.monotonic()
+        if (
+            not self._stale
+            and self._refreshed_at is not None
+            and now - self._refreshed_at < refresh_interval
+        ):
+            return
+        with self._lock:
+            self._stale = False
+            entries, max_uid = self._entries, self._max_uid
+            if (
+                self._reloaded_at is None
+                or now - self._reloaded_at >= self.full_reload_interval
+            ):
+                entries, max_uid = [], 0
+                self._reloaded_at = now
+            rows = db.session.execute(
+                select(Contractor.uid, Contractor.name)
+                .where(Contractor.uid > max_uid)
+                .order_by(Contractor.uid)
+            ).all()
+            if rows or not max_uid:
+                # build a new list so concurrent readers never see a partial sort
+                entries = entries + [
+                    (normalize_name(name), uid, name) for uid, name in rows
+                ]
+                entries.sort()
+                self._entries = entries
+                self._max_uid = rows[-1].uid if rows else 0
+            self._refreshed_at = now
+
+    def search(self, prefix, offset=0, limit=20):
+        """
+        Args:
+            prefix (str): Start of the contractor name, any case
+            offset (int): Matches to skip
+            limit (int): Matches to return
+
+        Returns:
+            tuple: (list of (uid, name), total number of matches)
+        """
+        entries = self._entries
+        key = normalize_name(prefix)
+        lo = bisect_left(entries, (key,))
+        hi = bisect_left(entries, (key + "\U0010ffff",)) if key else len(entries)
+        start = min(lo + offset, hi)
+        end = min(start + limit, hi)
+        return [(uid, name) for _, uid, name in entries[start:end]], hi - lo
+
+
+contractor_index = ContractorPrefixIndex()
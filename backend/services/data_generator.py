@@ -0,0 +1,124 @@
+"""
+Synthetic transaction generation for capacity testing
+
+Everything here is plain Python with no app or database access, so chunks
+can be generated in worker processes while the parent inserts.
+"""
+import random
+from datetime import timedelta
+
+from models.enums import STATUS_ORDER, CurrencyEnum, MethodEnum, TransactionStatus
+
+DEFAULT_STATUS_WEIGHTS = "sent=0.2,payed=0.5,received=0.3"
+DEFAULT_CURRENCY_WEIGHTS = "USD=0.7,EUR=0.2,GBP=0.1"
+DEFAULT_METHOD_WEIGHTS = "card payment=0.5,transaction=0.3,online transfer=0.2"
+
+TRANSACTION_COLUMNS = (
+    "contractor_id",
+    "amount",
+    "currency",
+    "method",
+    "status",
+    "tracking_id",
+    "sent_at",
+    "payed_at",
+    "received_at",
+    "created_at",
+    "updated_at",
+)
+
+# mean hours spent in the previous status before reaching each status
+STATUS_DELAY_HOURS = {TransactionStatus.RECEIVED: 24, TransactionStatus.PAYED: 48}
+# statuses a transaction in each status went through, in order
+STATUS_PATHS = {
+    status.value: STATUS_ORDER[: index + 1] for index, status in enumerate(STATUS_ORDER)
+}
+
+# set per worker process by init_worker
+_contractor_uids = None
+
+
+def parse_weights(value, enum_class):
+    """
+    Parse "a=0.2,b=0.8" into ([a, b], [0.2, 0.8]) checking names against enum_class
+
+    Raises:
+        ValueError: A name is not a value of enum_class or a weight is invalid
+    """
+    names, weights = [], []
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        enum_class(name)
+        weight = float(weight)
+        if weight < 0:
+            raise ValueError(f"Negative weight for {name}")
+        names.append(name)
+        weights.append(weight)
+    if not sum(weights):
+        raise ValueError("Weights must not all be zero")
+    return names, weights
+
+
+def init_worker(contractor_uids):
+    global _contractor_uids
+    _contractor_uids = contractor_uids
+
+
+def generate_chunk(spec):
+    """
+    Generate one chunk of transaction rows
+
+    Args:
+        spec (dict): chunk index and size, seed, end date, days and the
+            weights/amount parameters, see the fill_db command
+
+    Returns:
+        list: tuples ordered like TRANSACTION_COLUMNS
+    """
+    seed = spec["seed"]
+    rng = random.Random(None if seed is None else seed * 1000003 + spec["index"])
+    statuses, status_weights = spec["statuses"]
+    currencies, currency_weights = spec["currencies"]
+    methods, method_weights = spec["methods"]
+    size = spec["size"]
+    end = spec["end"]
+    span = spec["days"] * 86400
+
+    status_draws = rng.choices(statuses, status_weights, k=size)
+    currency_draws = rng.choices(currencies, currency_weights, k=size)
+    method_draws = rng.choices(methods, method_weights, k=size)
+    contractors = _contractor_uids
+    rows = []
+    for i in range(size):
+        created_at = end - timedelta(seconds=rng.random() * span)
+        status = status_draws[i]
+        reached_at = created_at
+        stamps = {}
+        for step in STATUS_PATHS[status]:
+            if step in STATUS_DELAY_HOURS:
+                reached_at += timedelta(hours=rng.expovariate(1 / STATUS_DELAY_HOURS[step]))
+            stamps[step] = reached_at
+        rows.append(
+            (
+                rng.choice(contractors),
+                -round(rng.lognormvariate(spec["amount_mu"], spec["amount_sigma"]), 2),
+                currency_draws[i],
+                method_draws[i],
+                status,
+                "%032x" % rng.getrandbits(128),
+                stamps[TransactionStatus.SENT],
+                stamps.get(TransactionStatus.PAYED),
+                stamps.get(TransactionStatus.RECEIVED),
+                created_at,
+                reached_at,
+            )
+        )
+    return rows
+
+
+def chunk_specs(total, chunk_size, **params):
+    """Split total rows into chunk specs for generate_chunk"""
+    for index, start in enumerate(range(0, total, chunk_size)):
+        yield {"index": index, "size": min(chunk_size, total - start), **params}
+
@@ -0,0 +1,83 @@
+import csv
+import io
+import json
+from datetime import datetime
+from enum import Enum
+
+from sqlalchemy import select
+
+from app import db
+from models.contractors import Contractor
+from models.transactions import Transaction
+from services.transactions import build_transactions_select
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+EXPORT_COLUMNS = (
+    Transaction.uid,
+    Transaction.created_at,
+    Transaction.updated_at,
+    Transaction.status,
+    Transaction.sent_at,
+    Transaction.payed_at,
+    Transaction.received_at,
+    Transaction.currency,
+    Transaction.amount,
+    Transaction.method,
+    Transaction.tracking_id,
+    Transaction.contractor_id,
+    Contractor.name.label("contractor_name"),
+)
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+
+def export_value(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def export_select(filters):
+    """get_transactions filters and ordering applied to flat export rows"""
+    stmt = select(*EXPORT_COLUMNS).outerjoin(Contractor, Transaction.contractor)
+    return build_transactions_select(filters, stmt=stmt, contractor_joined=True)
+
+
+def export_batches(filters, batch_size=1000):
+    """
+    Yield lists of export rows read through a server-side cursor
+
+    Only batch_size rows are held in memory at a time whatever the size of
+    the export.
+    """
+    result = db.session.execute(
+        export_select(filters).execution_options(yield_per=batch_size)
+    )
+    for batch in result.partitions():
+        yield [[export_value(value) for value in row] for row in batch]
+
+
+def csv_chunks(batches):
+    """Encode export batches as CSV, one chunk per batch"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    yield buffer.getvalue()
+    for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(batches):
+    """Encode export batches as newline delimited JSON, one chunk per batch"""
+    for batch in batches:
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_FIELDS, row))) + "\n" for row in batch
+        )
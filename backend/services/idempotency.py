@@ -0,0 +1,74 @@
+import hashlib
+import json
+from collections import namedtuple
+
+from flask import current_app
+
+from app import db
+from models.idempotency import IdempotencyKey
+from utils.cache import LRUCache
+
+MAX_KEY_LENGTH = 255
+
+# what a replay needs, cached per (user id, key)
+StoredResponse = namedtuple("StoredResponse", "fingerprint status_code body")
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used with a different request body"""
+
+
+def init_idempotency(app):
+    app.extensions["idempotency_cache"] = LRUCache(
+        maxsize=app.config.get("IDEMPOTENCY_CACHE_SIZE", 10000),
+        ttl=app.config.get("IDEMPOTENCY_KEY_TTL_HOURS", 24) * 3600,
+    )
+
+
+def fingerprint(data):
+    return hashlib.sha256(
+        json.dumps(data, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def stored_response(user_id, key, request_fingerprint):
+    """
+    Response of an earlier request with this key, from the cache or the database
+
+    Returns:
+        StoredResponse: or None for a new key
+
+    Raises:
+        IdempotencyConflict: The key was used for another request body
+    """
+    cache = current_app.extensions["idempotency_cache"]
+    stored = cache.get((user_id, key))
+    if stored is None:
+        row = IdempotencyKey.get(user_id, key)
+        if row is None:
+            return None
+        stored = StoredResponse(row.fingerprint, row.status_code, json.loads(row.response))
+        cache.set((user_id, key), stored)
+    if stored.fingerprint != request_fingerprint:
+        raise IdempotencyConflict()
+    return stored
+
+
+def record_response(user_id, key, request_fingerprint, status_code, body, transaction_id=None):
+    """Add the key row to the current session, commit it with the created rows"""
+    db.session.add(
+        IdempotencyKey(
+            user_id=user_id,
+            key=key,
+            fingerprint=request_fingerprint,
+            transaction_id=transaction_id,
+            status_code=status_code,
+            response=json.dumps(body, default=str),
+        )
+    )
+    return StoredResponse(request_fingerprint, status_code, body)
+
+
+def remember(user_id, key, stored):
+    """Cache a response once its commit went through"""
+    current_app.extensions["idempotency_cache"].set((user_id, key), stored)
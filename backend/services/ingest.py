@@ -0,0 +1,175 @@
+import json
+from itertools import islice
+from types import SimpleNamespace
+
+from marshmallow import ValidationError
+from sqlalchemy import insert, select
+
+from app import db
+from models.contractors import Contractor
+from models.enums import CurrencyEnum, MethodEnum, TransactionStatus
+from models.rollups import TransactionRollup
+from models.transactions import Transaction
+from schema.transactions import AddTransactionSchema
+from utils.utils import get_date
+
+add_transaction_schema = AddTransactionSchema()
+
+
+def parse_ndjson(lines):
+    """Yield one decoded item per non empty NDJSON line, or the decoding error"""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValidationError(f"Invalid JSON: {str(e)}")
+
+
+def validate_item(item):
+    """
+    Validate one bulk item the same way add_transaction validates its body
+
+    Returns:
+        dict: loaded item
+
+    Raises:
+        ValidationError: The item is invalid
+    """
+    if isinstance(item, ValidationError):
+        raise item
+    if not isinstance(item, dict):
+        raise ValidationError("Each item must be a JSON object")
+    data = add_transaction_schema.load(item)
+    try:
+        data["currency"] = CurrencyEnum(data.get("currency", CurrencyEnum.USD.value)).value
+        data["method"] = MethodEnum(data.get("method", MethodEnum.TRANSACTION.value)).value
+    except ValueError as e:
+        raise ValidationError(str(e))
+    return data
+
+
+def resolve_contractors(items):
+    """
+    Map every item to a contractor uid, creating missing contractors
+
+    Runs one query for the given ids and one multi-row upsert for the names
+    that are not cached yet.
+
+    Args:
+        items (list): validated items
+
+    Returns:
+        list: contractor uid per item
+    """
+    ids = {item["contractor_id"] for item in items if item.get("contractor_id")}
+    known_ids = set()
+    if ids:
+        known_ids = set(
+            db.session.execute(select(Contractor.uid).where(Contractor.uid.in_(ids)))
+            .scalars()
+            .all()
+        )
+
+    # like add_transaction, an unknown contractor_id falls back to the name
+    names = {
+        item["contractor_name"]
+        for item in items
+        if item.get("contractor_id") not in known_ids
+    }
+    uid_by_name = Contractor.get_or_create_many(names)
+
+    return [
+        item["contractor_id"]
+        if item.get("contractor_id") in known_ids
+        else uid_by_name[item["contractor_name"]]
+        for item in items
+    ]
+
+
+def insert_chunk(items):
+    """
+    Insert one chunk of validated items in a single unit of work
+
+    Returns:
+        list: (uid, tracking_id) per item, in the order of items
+    """
+    contractor_uids = resolve_contractors(items)
+    now = get_date()
+    rows = []
+    for item, contractor_uid in zip(items, contractor_uids):
+        rows.append(
+            {
+                "contractor_id": contractor_uid,
+                "amount": -item["amount"],
+                "currency": item["currency"],
+                "method": item["method"],
+                "tracking_id": item.get("tracking_id")
+                or Transaction.generate_tracking_id(contractor_uid, item["amount"]),
+                "sent_at": now,
+                "status": TransactionStatus.SENT.value,
+                "created_at": now,
+                "updated_at": now,
+            }
+        )
+    inserted = db.session.execute(
+        insert(Transaction).returning(Transaction.uid, sort_by_parameter_order=True),
+        rows,
+    )
+    uids = inserted.scalars().all()
+    TransactionRollup.record(*(SimpleNamespace(**row) for row in rows))
+    db.session.commit()
+    return [(uid, row["tracking_id"]) for uid, row in zip(uids, rows)]
+
+
+def ingest_transactions(items, chunk_size=1000):
+    """
+    Add transactions in chunks, committing once per chunk
+
+    Args:
+        items (iterable): raw items, dicts shaped like the add_transaction body
+        chunk_size (int): items per INSERT and commit
+
+    Returns:
+        list: one result dict per item with its index and status
+    """
+    results = []
+    index = 0
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            break
+        valid = []
+        positions = []
+        for item in chunk:
+            try:
+                valid.append(validate_item(item))
+                positions.append(index)
+                results.append(None)
+            except ValidationError as e:
+                results.append({"index": index, "status": "error", "errors": e.messages})
+            index += 1
+        if not valid:
+            continue
+        try:
+            created = insert_chunk(valid)
+        except Exception as e:
+            db.session.rollback()
+            for position in positions:
+                results[position] = {
+                    "index": position,
+                    "status": "error",
+                    "errors": f"Internal server error: {str(e)}",
+                }
+            continue
+        for position, (uid, tracking_id) in zip(positions, created):
+            results[position] = {
+                "index": position,
+                "status": "created",
+                "uid": uid,
+                "tracking_id": tracking_id,
+            }
+    return results
@@ -0,0 +1,196 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+# stats of the request handled by the current thread, None outside requests
+_current = ContextVar("request_stats", default=None)
+
+
+class RequestStats:
+    """Counters collected while one request is handled"""
+
+    __slots__ = ("started", "queries", "sql_time", "serialize_time", "lazy_loads")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+        # lazy load shape -> count, filled by services.query_budget
+        self.lazy_loads = {}
+
+
+def current_stats():
+    return _current.get()
+
+
+@contextmanager
+def timed_serialization():
+    """Count the time spent in the block as serialization time of the request"""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serialize_time += time.perf_counter() - start
+
+
+class Histogram:
+    """Cumulative histogram per label value (endpoint by default) in Prometheus format"""
+
+    def __init__(self, name, help_text, buckets, label_name="endpoint"):
+        self.name = name
+        self.label_name = label_name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label, value):
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {label: (list(s[0]), s[1], s[2]) for label, s in self._series.items()}
+        for label, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            tag = f'{self.label_name}="{label}"'
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{tag},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{tag},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{tag}}} {total}")
+            lines.append(f"{self.name}_count{{{tag}}} {count}")
+        return lines
+
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "Total request latency", LATENCY_BUCKETS
+)
+sql_duration = Histogram(
+    "http_request_sql_duration_seconds", "Time spent in SQL per request", LATENCY_BUCKETS
+)
+serialize_duration = Histogram(
+    "http_request_serialize_duration_seconds",
+    "Time spent serializing responses per request",
+    LATENCY_BUCKETS,
+)
+query_count = Histogram(
+    "http_request_queries", "SQL statements executed per request", QUERY_BUCKETS
+)
+HISTOGRAMS = (request_duration, sql_duration, serialize_duration, query_count)
+
+
+def render_metrics():
+    """All histograms in the Prometheus text exposition format"""
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # kept on the execution context, which a failing statement takes with it
+    if context is not None and _current.get() is not None:
+        context.metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    started = getattr(context, "metrics_started", None)
+    if started is not None:
+        stats.sql_time += time.perf_counter() - started
+    stats.queries += 1
+
+
+_listening = False
+
+
+def start_stats():
+    """Start collecting stats for the current context, returns them"""
+    stats = RequestStats()
+    _current.set(stats)
+    return stats
+
+
+def stop_stats(previous=None):
+    """
+    Stop collecting, restoring previous stats when collection was nested and
+    adding the queries made meanwhile to them
+    """
+    stats = _current.get()
+    _current.set(previous)
+    if previous is not None and stats is not None and stats is not previous:
+        previous.queries += stats.queries
+        previous.sql_time += stats.sql_time
+
+
+def init_metrics(app):
+    """
+    Collect per-request SQL and latency stats when METRICS_ENABLED is set,
+    or when QUERY_BUDGET_MODE needs them
+    """
+    global _listening
+    metrics_enabled = app.config.get("METRICS_ENABLED", True)
+    if not metrics_enabled and app.config.get("QUERY_BUDGET_MODE", "off") == "off":
+        return
+    if not _listening:
+        # listening on the Engine class covers every bind
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        _listening = True
+
+    @app.before_request
+    def start_request_stats():
+        # stats of an enclosing assert_max_queries, as when a test calls the view
+        g.outer_request_stats = current_stats()
+        start_stats()
+
+    @app.teardown_request
+    def clear_request_stats(exc):
+        stop_stats(g.pop("outer_request_stats", None))
+
+    if not metrics_enabled:
+        return
+
+    @app.after_request
+    def record_request_stats(response):
+        stats = _current.get()
+        if stats is None:
+            return response
+        total = time.perf_counter() - stats.started
+        endpoint = request.endpoint or "unmatched"
+        request_duration.observe(endpoint, total)
+        sql_duration.observe(endpoint, stats.sql_time)
+        serialize_duration.observe(endpoint, stats.serialize_time)
+        query_count.observe(endpoint, stats.queries)
+        response.headers["Server-Timing"] = (
+            f'db;dur={stats.sql_time * 1000:.2f};desc="{stats.queries} queries", '
+            f"serialize;dur={stats.serialize_time * 1000:.2f}, "
+            f"total;dur={total * 1000:.2f}"
+        )
+        return response
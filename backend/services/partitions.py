@@ -0,0 +1,222 @@
+"""
+Monthly range partitions of transactions on created_at, PostgreSQL only
+
+Partitioned, recent months live in their own tables, so the indexes and
+vacuum of hot data stay small. Queries with both a lower and an upper
+created_at bound inside the created months only read those months.
+
+The default partition catches rows outside every month and can only be
+pruned by such bounded queries. The unbounded default listing
+(ORDER BY created_at DESC, uid DESC LIMIT n) therefore gets no ordered
+partition scan. It merges the head of every partition's (created_at, uid)
+index instead, one index descent per attached partition rather than a
+read of the newest month alone. Archiving old months keeps that count
+small, see services.archive.
+
+From an Alembic migration:
+
+    from services.partitions import create_partitions, partition_transactions
+
+    def upgrade():
+        partition_transactions(op.get_bind())
+
+and later revisions, or 'flask commands create-partitions' from cron, keep
+PARTITION_MONTHS_AHEAD months of partitions created ahead of time:
+
+    def upgrade():
+        create_partitions(op.get_bind(), months_ahead=3)
+"""
+import re
+from datetime import date
+
+from sqlalchemy import text
+
+from models.transactions import Transaction
+from utils.utils import get_date
+
+PARENT = Transaction.__tablename__
+# rows outside every month partition, so no insert fails for want of one
+DEFAULT_PARTITION = f"{PARENT}_default"
+PARTITION_PATTERN = re.compile(rf"^{PARENT}_y(\d{{4}})m(\d{{2}})$")
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{PARENT}_y{month.year:04d}m{month.month:02d}"
+
+
+def partition_month(name):
+    """First day of the month a partition holds, None for any other table"""
+    match = PARTITION_PATTERN.match(name)
+    return date(int(match[1]), int(match[2]), 1) if match else None
+
+
+def _require_postgresql(connection):
+    if connection.dialect.name != "postgresql":
+        raise RuntimeError("Partitioning needs PostgreSQL")
+
+
+def is_partitioned(connection):
+    if connection.dialect.name != "postgresql":
+        return False
+    return bool(
+        connection.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table "
+                "WHERE partrelid = to_regclass(:parent)"
+            ),
+            {"parent": PARENT},
+        ).scalar()
+    )
+
+
+def list_partitions(connection):
+    """
+    Returns:
+        list: (month, table name) of the attached month partitions, oldest first
+    """
+    _require_postgresql(connection)
+    names = connection.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(:parent)"
+        ),
+        {"parent": PARENT},
+    ).scalars()
+    return sorted(
+        (partition_month(name), name) for name in names if partition_month(name)
+    )
+
+
+def _create_month(connection, month):
+    name = partition_name(month)
+    bounds = f"FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    params = {"start": month, "end": add_months(month, 1)}
+    stray = connection.execute(
+        text(
+            f"SELECT 1 FROM {DEFAULT_PARTITION} "
+            "WHERE created_at >= :start AND created_at < :end LIMIT 1"
+        ),
+        params,
+    ).scalar()
+    if not stray:
+        connection.execute(
+            text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT} FOR VALUES {bounds}")
+        )
+        return
+    # rows of this month already landed in the default partition, move them
+    # first as attaching checks the default partition holds none
+    connection.execute(
+        text(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    )
+    connection.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            "WHERE created_at >= :start AND created_at < :end RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ),
+        params,
+    )
+    connection.execute(text(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES {bounds}"))
+
+
+def create_partitions(connection, months_ahead=3, start=None):
+    """
+    Create the default partition and the missing month partitions from
+    start (default: this month) through months_ahead months from now, safe
+    to run repeatedly
+
+    Returns:
+        list: names of the partitions created
+    """
+    existing = {name for _, name in list_partitions(connection)}
+    connection.execute(
+        text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT")
+    )
+    month = month_start(start or get_date())
+    last = add_months(month_start(get_date()), months_ahead)
+    created = []
+    while month <= last:
+        if partition_name(month) not in existing:
+            _create_month(connection, month)
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def partition_transactions(connection, months_ahead=3):
+    """
+    Turn the plain transactions table into one partitioned by month, in
+    the caller's transaction
+
+    The primary key becomes (uid, created_at) as PostgreSQL requires the
+    partition key in it, so foreign keys pointing at transactions.uid can
+    not be kept and are dropped with the old table. The pg_trgm search index
+    has to be recreated afterwards.
+
+    Returns:
+        tuple: (names of the partitions created, "table.constraint" names
+            of the dropped foreign keys)
+    """
+    _require_postgresql(connection)
+    if is_partitioned(connection):
+        return [], []
+    legacy = f"{PARENT}_unpartitioned"
+
+    def execute(statement):
+        connection.execute(text(statement))
+
+    execute(f"ALTER TABLE {PARENT} RENAME TO {legacy}")
+    execute(
+        f"UPDATE {legacy} SET created_at = COALESCE(updated_at, now()) "
+        "WHERE created_at IS NULL"
+    )
+    execute(
+        f"CREATE TABLE {PARENT} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+        "PARTITION BY RANGE (created_at)"
+    )
+    execute(f"ALTER TABLE {PARENT} ALTER COLUMN created_at SET NOT NULL")
+    first = connection.execute(text(f"SELECT min(created_at) FROM {legacy}")).scalar()
+    created = create_partitions(connection, months_ahead, start=first)
+    execute(f"INSERT INTO {PARENT} SELECT * FROM {legacy}")
+
+    # the uid sequence is owned by the old table and would go with it
+    sequence = connection.execute(
+        text("SELECT pg_get_serial_sequence(:table, 'uid')"), {"table": legacy}
+    ).scalar()
+    if sequence:
+        execute(f"ALTER SEQUENCE {sequence} OWNED BY {PARENT}.uid")
+    dropped = (
+        connection.execute(
+            text(
+                "SELECT conrelid::regclass::text || '.' || conname FROM pg_constraint "
+                "WHERE contype = 'f' AND confrelid = to_regclass(:table)"
+            ),
+            {"table": legacy},
+        )
+        .scalars()
+        .all()
+    )
+    execute(f"DROP TABLE {legacy} CASCADE")
+
+    execute(f"ALTER TABLE {PARENT} ADD PRIMARY KEY (uid, created_at)")
+    execute(
+        f"ALTER TABLE {PARENT} ADD FOREIGN KEY (contractor_id) REFERENCES contractors (uid)"
+    )
+    for index in Transaction.__table__.indexes:
+        index.create(connection, checkfirst=True)
+    return created, dropped
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    """Keep Alembic autogenerate from dropping the partition tables"""
+    return not (type_ == "table" and reflected and partition_month(name))
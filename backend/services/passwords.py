@@ -0,0 +1,101 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PasswordPoolBusy(Exception):
+    """Every hashing worker is busy and the wait queue is full"""
+
+
+class PasswordPool:
+    """
+    Process pool for password hashing, bounded to workers + queue_size tasks
+
+    Hashing is slow on purpose. Running it in other processes keeps request
+    threads and the GIL free, and rejecting work beyond the queue keeps a
+    login burst from piling up behind it.
+    """
+
+    def __init__(self, workers=2, queue_size=16, timeout=10.0):
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # created on first use, so forked server workers each start their own
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def run(self, func, *args):
+        """
+        Run func(*args) in the pool and wait for its result
+
+        Raises:
+            PasswordPoolBusy: The queue is full or the result took longer than timeout
+        """
+        if not self._slots.acquire(blocking=False):
+            raise PasswordPoolBusy()
+        try:
+            future = self._get_executor().submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise PasswordPoolBusy()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def init_password_pool(app):
+    """Hash in a process pool unless PASSWORD_POOL_WORKERS is 0"""
+    workers = app.config.get("PASSWORD_POOL_WORKERS", 2)
+    if workers <= 0:
+        return
+    app.extensions["password_pool"] = PasswordPool(
+        workers,
+        app.config.get("PASSWORD_POOL_QUEUE_SIZE", 16),
+        app.config.get("PASSWORD_POOL_TIMEOUT", 10.0),
+    )
+
+
+def _run(func, *args):
+    pool = current_app.extensions.get("password_pool")
+    if pool is None:
+        return func(*args)
+    return pool.run(func, *args)
+
+
+def hash_password(password):
+    """
+    Hash with the configured PASSWORD_HASH_METHOD
+
+    Raises:
+        PasswordPoolBusy: The hashing pool is saturated
+    """
+    return _run(generate_password_hash, password, current_app.config["PASSWORD_HASH_METHOD"])
+
+
+def check_password(password_hash, password):
+    """
+    Raises:
+        PasswordPoolBusy: The hashing pool is saturated
+    """
+    return _run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """Whether the hash was made with other parameters than PASSWORD_HASH_METHOD"""
+    return password_hash.split("$", 1)[0] != current_app.config["PASSWORD_HASH_METHOD"]
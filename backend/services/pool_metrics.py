@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+from services.metrics import LATENCY_BUCKETS, Histogram
+from utils.replicas import REPLICA_BIND_PREFIX
+
+logger = logging.getLogger(__name__)
+
+checkout_wait = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time to get a connection from the pool, connecting included",
+    LATENCY_BUCKETS,
+    label_name="pool",
+)
+# pool label -> PoolStats, filled by init_pool_metrics
+pool_stats = {}
+
+
+class PoolStats:
+    """Event counters of one connection pool"""
+
+    COUNTERS = (
+        ("checkouts", "Connections handed out"),
+        ("overflow_checkouts", "Checkouts beyond pool_size"),
+        ("timeouts", "Checkouts that gave up after pool_timeout"),
+        ("connects", "New database connections"),
+        ("recycles", "Connections replaced after pool_recycle"),
+        ("invalidations", "Connections dropped as broken, failed pre-pings included"),
+    )
+
+    def __init__(self, label, pool):
+        self.label = label
+        self.pool = pool
+        self.peak_overflow = 0
+        self._lock = threading.Lock()
+        for name, _ in self.COUNTERS:
+            setattr(self, name, 0)
+
+    def incr(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def checked_out(self, wait):
+        overflow = max(self.pool.overflow(), 0)
+        with self._lock:
+            self.checkouts += 1
+            if overflow:
+                self.overflow_checkouts += 1
+                self.peak_overflow = max(self.peak_overflow, overflow)
+        checkout_wait.observe(self.label, wait)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool timing every checkout into its PoolStats"""
+
+    stats = None
+
+    def _do_get(self):
+        if self.stats is None:
+            return super()._do_get()
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.incr("timeouts")
+            logger.warning("%s pool timed out, %s", self.stats.label, self.status())
+            raise
+        self.stats.checked_out(time.perf_counter() - start)
+        return record
+
+    def recreate(self):
+        # engine.dispose() swaps in a new pool, the counters carry over
+        pool = super().recreate()
+        pool.stats = self.stats
+        if self.stats is not None:
+            self.stats.pool = pool
+        return pool
+
+
+def configure_pool(app):
+    """
+    Use InstrumentedQueuePool for queue pooled engines and give replicas the
+    primary's pool options, must run after configure_replicas and before
+    db.init_app
+    """
+    options = app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {}
+    if "pool_size" not in options:
+        return
+    if "poolclass" not in options:
+        options = app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+            **options,
+            "poolclass": InstrumentedQueuePool,
+        }
+    # Flask-SQLAlchemy only applies SQLALCHEMY_ENGINE_OPTIONS to the default bind
+    binds = app.config.get("SQLALCHEMY_BINDS") or {}
+    for bind_key in binds:
+        if bind_key.startswith(REPLICA_BIND_PREFIX) and isinstance(binds[bind_key], str):
+            binds[bind_key] = {**options, "url": binds[bind_key]}
+
+
+def _listen(pool, stats):
+    def on_connect(dbapi_connection, connection_record):
+        stats.incr("connects")
+        # record_info outlives the DBAPI connection, a record connecting
+        # again without having been invalidated was recycled
+        info = connection_record.record_info
+        if info.get("connected") and not info.pop("invalidated", False):
+            stats.incr("recycles")
+        info["connected"] = True
+
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        stats.incr("invalidations")
+        connection_record.record_info["invalidated"] = True
+
+    event.listen(pool, "connect", on_connect)
+    event.listen(pool, "invalidate", on_invalidate)
+    event.listen(pool, "soft_invalidate", on_invalidate)
+
+
+def init_pool_metrics(engines):
+    """Attach PoolStats to every instrumented pool, labelled by bind key"""
+    for bind_key, engine in engines.items():
+        pool = engine.pool
+        if not isinstance(pool, InstrumentedQueuePool) or pool.stats is not None:
+            continue
+        label = bind_key or "primary"
+        pool.stats = pool_stats[label] = PoolStats(label, pool)
+        _listen(pool, pool.stats)
+
+
+def warm_pools(engines, connections):
+    """
+    Open up to connections connections per queue pool and return them to
+    it, so the first requests do not pay for connecting
+
+    A database that is down is logged, not raised, the pool then connects
+    lazily as it always has.
+    """
+    for bind_key, engine in engines.items():
+        if not isinstance(engine.pool, QueuePool):
+            continue
+        count = min(connections, engine.pool.size())
+        start = time.perf_counter()
+        opened = []
+        try:
+            for _ in range(count):
+                opened.append(engine.raw_connection())
+        except Exception as e:
+            logger.warning("Pool warm-up of %s failed: %s", bind_key or "primary", e)
+        finally:
+            for connection in opened:
+                connection.close()
+        if opened:
+            logger.info(
+                "Warmed %d %s connections in %.1f ms",
+                len(opened),
+                bind_key or "primary",
+                (time.perf_counter() - start) * 1000,
+            )
+
+
+def render_pool_metrics():
+    """Pool counters and gauges in the Prometheus text exposition format"""
+    lines = checkout_wait.render()
+    stats = sorted(pool_stats.items())
+    for name, help_text in PoolStats.COUNTERS:
+        metric = f"db_pool_{name}_total"
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        lines += [f'{metric}{{pool="{label}"}} {getattr(s, name)}' for label, s in stats]
+    gauges = (
+        ("size", "Configured pool_size", lambda s: s.pool.size()),
+        ("checked_out", "Connections in use", lambda s: s.pool.checkedout()),
+        ("overflow", "Connections in use beyond pool_size", lambda s: max(s.pool.overflow(), 0)),
+        ("peak_overflow", "Most overflow connections used at once", lambda s: s.peak_overflow),
+    )
+    for name, help_text, value in gauges:
+        metric = f"db_pool_{name}"
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+        lines += [f'{metric}{{pool="{label}"}} {value(s)}' for label, s in stats]
+    return lines
@@ -0,0 +1,129 @@
+import logging
+from contextlib import contextmanager
+
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from services.metrics import current_stats, start_stats, stop_stats
+
+logger = logging.getLogger(__name__)
+
+BUDGET_MODES = ("off", "log", "raise")
+# "raise" only fails reads, a write over budget is already committed and
+# answering 500 would make the client retry it
+RAISE_METHODS = ("GET", "HEAD")
+BUDGET_HEADER = "X-Query-Budget-Exceeded"
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A request issued more queries than its budget, or repeated lazy loads"""
+
+
+def query_budget(max_queries):
+    """
+    Declare how many SQL statements a view may issue per request
+
+    Checked after every request when QUERY_BUDGET_MODE is "log" or "raise".
+    The budget is stored on the function and carried over by functools.wraps,
+    so the decorator can sit anywhere below the route decorator.
+    """
+
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+
+    return decorator
+
+
+def _record_lazy_load(orm_execute_state):
+    stats = current_stats()
+    if stats is None or not orm_execute_state.is_relationship_load:
+        return
+    parent = orm_execute_state.lazy_loaded_from
+    if parent is None:
+        return
+    # the same relationship loaded for many parents is the N+1 shape
+    shape = (
+        parent.class_.__name__,
+        tuple(mapper.class_.__name__ for mapper in orm_execute_state.all_mappers),
+    )
+    stats.lazy_loads[shape] = stats.lazy_loads.get(shape, 0) + 1
+
+
+def budget_violations(stats, max_queries=None, lazy_load_threshold=3):
+    """
+    Returns:
+        list: human readable problems found in stats, empty when within budget
+    """
+    problems = []
+    if max_queries is not None and stats.queries > max_queries:
+        problems.append(f"{stats.queries} queries, budget is {max_queries}")
+    for (parent, targets), count in stats.lazy_loads.items():
+        if count >= lazy_load_threshold:
+            problems.append(
+                f"possible N+1: {count} lazy loads of {', '.join(targets)} from {parent}"
+            )
+    return problems
+
+
+def _report(problems, response):
+    message = f"{request.endpoint}: " + "; ".join(problems)
+    if (
+        current_app.config.get("QUERY_BUDGET_MODE") == "raise"
+        and request.method in RAISE_METHODS
+    ):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+    response.headers[BUDGET_HEADER] = "; ".join(problems)
+
+
+@contextmanager
+def assert_max_queries(max_queries, lazy_load_threshold=3):
+    """
+    Fail when the block issues more than max_queries statements or repeats a
+    lazy load lazy_load_threshold times, for use in tests and scripts
+
+    Raises:
+        QueryBudgetExceeded: The block went over budget
+    """
+    outer = current_stats()
+    stats = start_stats()
+    try:
+        yield stats
+    finally:
+        stop_stats(outer)
+    problems = budget_violations(stats, max_queries, lazy_load_threshold)
+    if problems:
+        raise QueryBudgetExceeded("; ".join(problems))
+
+
+_listening = False
+
+
+def init_query_budget(app):
+    """Check query budgets and repeated lazy loads according to QUERY_BUDGET_MODE"""
+    global _listening
+    mode = app.config.get("QUERY_BUDGET_MODE", "off")
+    if mode not in BUDGET_MODES:
+        raise ValueError(f"QUERY_BUDGET_MODE must be one of {', '.join(BUDGET_MODES)}")
+    if mode == "off":
+        return
+    if not _listening:
+        event.listen(Session, "do_orm_execute", _record_lazy_load)
+        _listening = True
+
+    @app.after_request
+    def check_query_budget(response):
+        stats = current_stats()
+        if stats is None or request.endpoint is None:
+            return response
+        view = app.view_functions.get(request.endpoint)
+        problems = budget_violations(
+            stats,
+            getattr(view, "query_budget", None),
+            app.config.get("N_PLUS_ONE_THRESHOLD", 3),
+        )
+        if problems:
+            _report(problems, response)
+        return response
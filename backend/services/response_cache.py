@@ -0,0 +1,73 @@
+import hashlib
+import threading
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+from utils.cache import LRUCache
+
+
+class DataVersion:
+    """
+    Process wide counter bumped by every write to transactions or contractors
+
+    Cached responses are keyed on it, so a bump makes all of them unreachable.
+    Writes done by other worker processes are only seen once entries expire,
+    RESPONSE_CACHE_TTL bounds that staleness.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def bump(self):
+        with self._lock:
+            self.value += 1
+
+
+data_version = DataVersion()
+
+
+def init_response_cache(app):
+    app.extensions["response_cache"] = LRUCache(
+        maxsize=app.config.get("RESPONSE_CACHE_SIZE", 1024),
+        ttl=app.config.get("RESPONSE_CACHE_TTL", 10),
+    )
+
+
+def cached_response(view):
+    """
+    Cache successful GET responses and answer conditional requests
+
+    The key is the path, the sorted query parameters and the data version.
+    A request whose If-None-Match matches a cached entry gets a 304 without
+    running the view, and therefore without touching the database. There is
+    no Last-Modified: the data version is per process, so another worker's
+    write would not move it, while the ETag hashes the body itself.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        cache = current_app.extensions.get("response_cache")
+        if cache is None or not current_app.config.get("RESPONSE_CACHE_ENABLED", True):
+            return view(*args, **kwargs)
+
+        version = data_version.value
+        key = (request.path, tuple(sorted(request.args.items(multi=True))), version)
+        entry = cache.get(key)
+        if entry is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            body = response.get_data()
+            entry = (hashlib.sha1(body).hexdigest(), body, response.mimetype)
+            if version == data_version.value:
+                cache.set(key, entry)
+        else:
+            response = current_app.response_class(entry[1], mimetype=entry[2])
+
+        response.set_etag(entry[0])
+        response.headers["Cache-Control"] = "no-cache"
+        return response.make_conditional(request)
+
+    return wrapper
@@ -0,0 +1,278 @@
+import logging
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import func, literal, or_, select, text, union_all
+
+from app import db
+from models.contractors import Contractor
+from models.transactions import Transaction
+
+logger = logging.getLogger(__name__)
+
+# Trigram indexes can only serve terms of at least three characters
+MIN_INDEXED_TERM = 3
+
+
+def like_pattern(term):
+    """Escape LIKE wildcards in term and wrap it for a substring match"""
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def amount_values(term):
+    """Amounts a search term can refer to, amounts are stored negated for payments"""
+    try:
+        value = float(term)
+    except ValueError:
+        return []
+    return [value, -value]
+
+
+class TransactionSearch:
+    """
+    Search over contractor name, tracking_id and amount
+
+    Backends return a subquery of matching transaction uids with a rank column,
+    higher rank meaning a better match. This base class is the unindexed
+    fallback which uses ILIKE and works on every database.
+    """
+
+    name = "like"
+
+    def create_index(self):
+        """Create whatever indexes the backend needs, safe to run repeatedly"""
+
+    def matches(self, term):
+        """
+        Args:
+            term (str): Search term as typed by the user
+
+        Returns:
+            Subquery: columns uid and rank
+        """
+        pattern = like_pattern(term)
+        conditions = [
+            Contractor.name.ilike(pattern, escape="\\"),
+            Transaction.tracking_id.ilike(pattern, escape="\\"),
+        ]
+        if amount_values(term):
+            conditions.append(Transaction.amount.in_(amount_values(term)))
+        return (
+            select(Transaction.uid.label("uid"), literal(1.0).label("rank"))
+            .outerjoin(Contractor, Transaction.contractor)
+            .where(or_(*conditions))
+            .subquery("search_matches")
+        )
+
+
+class PostgresTrigramSearch(TransactionSearch):
+    """pg_trgm GIN indexes, ILIKE '%term%' becomes an index scan"""
+
+    name = "pg_trgm"
+    indexes = ("ix_contractors_name_trgm", "ix_transactions_tracking_id_trgm")
+
+    def create_index(self):
+        for statement in (
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            "CREATE INDEX IF NOT EXISTS ix_contractors_name_trgm "
+            "ON contractors USING gin (name gin_trgm_ops)",
+            "CREATE INDEX IF NOT EXISTS ix_transactions_tracking_id_trgm "
+            "ON transactions USING gin (tracking_id gin_trgm_ops)",
+        ):
+            db.session.execute(text(statement))
+        db.session.commit()
+
+    def matches(self, term):
+        if len(term) < MIN_INDEXED_TERM:
+            return super().matches(term)
+        pattern = like_pattern(term)
+        # each branch is served by its own index, the planner combines them
+        branches = [
+            select(
+                Transaction.uid.label("uid"),
+                func.similarity(Contractor.name, term).label("rank"),
+            )
+            .join(Contractor, Transaction.contractor)
+            .where(Contractor.name.ilike(pattern, escape="\\")),
+            select(
+                Transaction.uid.label("uid"),
+                func.similarity(Transaction.tracking_id, term).label("rank"),
+            ).where(Transaction.tracking_id.ilike(pattern, escape="\\")),
+        ]
+        if amount_values(term):
+            branches.append(
+                select(Transaction.uid.label("uid"), literal(1.0).label("rank")).where(
+                    Transaction.amount.in_(amount_values(term))
+                )
+            )
+        hits = union_all(*branches).subquery("search_hits")
+        return (
+            select(hits.c.uid, func.max(hits.c.rank).label("rank"))
+            .group_by(hits.c.uid)
+            .subquery("search_matches")
+        )
+
+
+class SqliteFtsSearch(TransactionSearch):
+    """
+    FTS5 table with the trigram tokenizer over contractor name and
+    tracking_id, kept in sync by triggers. The row id of the FTS table is the
+    transaction uid. Amounts match exactly, as with the other backends.
+    """
+
+    name = "fts5"
+    table = "transactions_fts"
+    triggers = ("insert", "delete", "update", "contractor_update")
+
+    def create_index(self):
+        # dropped first so the table and triggers always have the current layout
+        drops = [f"DROP TRIGGER IF EXISTS {self.table}_{name}" for name in self.triggers]
+        for statement in (
+            *drops,
+            f"DROP TABLE IF EXISTS {self.table}",
+            f"CREATE VIRTUAL TABLE {self.table} "
+            "USING fts5(contractor_name, tracking_id, tokenize='trigram')",
+            f"""CREATE TRIGGER {self.table}_insert
+            AFTER INSERT ON transactions BEGIN
+                INSERT INTO {self.table}(rowid, contractor_name, tracking_id)
+                VALUES (
+                    new.uid,
+                    (SELECT name FROM contractors WHERE uid = new.contractor_id),
+                    new.tracking_id
+                );
+            END""",
+            f"""CREATE TRIGGER {self.table}_delete
+            AFTER DELETE ON transactions BEGIN
+                DELETE FROM {self.table} WHERE rowid = old.uid;
+            END""",
+            f"""CREATE TRIGGER {self.table}_update
+            AFTER UPDATE OF contractor_id, tracking_id ON transactions BEGIN
+                DELETE FROM {self.table} WHERE rowid = old.uid;
+                INSERT INTO {self.table}(rowid, contractor_name, tracking_id)
+                VALUES (
+                    new.uid,
+                    (SELECT name FROM contractors WHERE uid = new.contractor_id),
+                    new.tracking_id
+                );
+            END""",
+            f"""CREATE TRIGGER {self.table}_contractor_update
+            AFTER UPDATE OF name ON contractors BEGIN
+                UPDATE {self.table} SET contractor_name = new.name
+                WHERE rowid IN (SELECT uid FROM transactions WHERE contractor_id = new.uid);
+            END""",
+            f"""INSERT INTO {self.table}(rowid, contractor_name, tracking_id)
+            SELECT transactions.uid, contractors.name, transactions.tracking_id
+            FROM transactions
+            LEFT OUTER JOIN contractors ON contractors.uid = transactions.contractor_id""",
+        ):
+            db.session.execute(text(statement))
+        db.session.commit()
+
+    def matches(self, term):
+        if len(term) < MIN_INDEXED_TERM:
+            return super().matches(term)
+        # a quoted FTS5 string is a substring match with the trigram tokenizer
+        phrase = '"' + term.replace('"', '""') + '"'
+        text_hits = text(
+            f"SELECT rowid AS uid, -bm25({self.table}) AS rank "
+            f"FROM {self.table} WHERE {self.table} MATCH :search_phrase"
+        ).bindparams(search_phrase=phrase).columns(uid=db.Integer, rank=db.Float)
+        if not amount_values(term):
+            return text_hits.subquery("search_matches")
+        hits = union_all(
+            select(Transaction.uid.label("uid"), literal(1.0).label("rank")).where(
+                Transaction.amount.in_(amount_values(term))
+            ),
+            text_hits,
+        ).subquery("search_hits")
+        return (
+            select(hits.c.uid, func.max(hits.c.rank).label("rank"))
+            .group_by(hits.c.uid)
+            .subquery("search_matches")
+        )
+
+
+# engine url -> (backend, time.monotonic() of the check)
+_backends = {}
+# engine url -> thread checking the backend again, see search_backend
+_refreshing = {}
+_refresh_lock = threading.Lock()
+
+
+def detect_backend(engine, mode="auto"):
+    """
+    Indexed backends are only used while their indexes exist, see the
+    create_search_index command, so dropping them (partition_transactions
+    does) falls back to ILIKE
+    """
+    if mode != "auto":
+        return TransactionSearch()
+    with engine.connect() as connection:
+        if engine.dialect.name == "postgresql":
+            found = connection.execute(
+                text("SELECT count(*) FROM pg_indexes WHERE indexname = ANY(:names)"),
+                {"names": list(PostgresTrigramSearch.indexes)},
+            ).scalar()
+            if found == len(PostgresTrigramSearch.indexes):
+                return PostgresTrigramSearch()
+        elif engine.dialect.name == "sqlite":
+            exists = connection.execute(
+                text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                {"name": SqliteFtsSearch.table},
+            ).scalar()
+            if exists:
+                return SqliteFtsSearch()
+    return TransactionSearch()
+
+
+def _refresh(engine, mode, current):
+    try:
+        backend = detect_backend(engine, mode)
+    except Exception as e:
+        logger.warning("Search backend check failed, keeping %s: %s", current.name, e)
+        backend = current
+    _backends[engine.url] = (backend, time.monotonic())
+    with _refresh_lock:
+        _refreshing.pop(engine.url, None)
+
+
+def search_backend():
+    """
+    Search backend for the current database, chosen per engine
+
+    Only the first call per engine queries the database, the async app makes
+    it at startup. Once SEARCH_BACKEND_CHECK_SECONDS have passed the backend
+    is checked again in a background thread while requests keep using the
+    current one, so neither request threads nor the event loop wait on it.
+    """
+    engine = db.session.get_bind()
+    mode = current_app.config.get("SEARCH_BACKEND", "auto")
+    cached = _backends.get(engine.url)
+    if cached is None:
+        backend = detect_backend(engine, mode)
+        _backends[engine.url] = (backend, time.monotonic())
+        return backend
+
+    backend, checked_at = cached
+    max_age = current_app.config.get("SEARCH_BACKEND_CHECK_SECONDS", 60)
+    if time.monotonic() - checked_at >= max_age:
+        with _refresh_lock:
+            if engine.url not in _refreshing:
+                thread = threading.Thread(
+                    target=_refresh, args=(engine, mode, backend), daemon=True
+                )
+                _refreshing[engine.url] = thread
+                thread.start()
+    return backend
+
+
+def indexed_backend():
+    """The indexed backend for the current dialect, used to build its index"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return PostgresTrigramSearch()
+    if dialect == "sqlite":
+        return SqliteFtsSearch()
+    return TransactionSearch()
@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import select
+
+from app import db
+from models.token import Token
+from utils.bloom import BloomFilter
+from utils.utils import get_date
+
+logger = logging.getLogger(__name__)
+
+ERROR_RATE = 0.01
+# tokens issued this close to the last rebuild may be missing from it
+TRUST_MARGIN = 60
+
+
+class RefreshTokenFilter:
+    """
+    Bloom filter of the hashes of all live refresh tokens
+
+    Refresh tokens carry their issue time, signed with SECRET_KEY, see
+    Token.generate_tokens. A token issued well before the last rebuild must
+    be in the filter if it is still stored, so a miss rejects it without a
+    query. Newer tokens, possibly issued by another worker process, are
+    looked up, which forged tokens can not claim to be without the key.
+    """
+
+    def __init__(self):
+        # (BloomFilter, time.time() its query started), swapped as one
+        self._state = None
+        self._rebuilt_at = None
+        self._stale = True
+        self._rebuilding = False
+        self._lock = threading.Lock()
+
+    def add(self, token_hash):
+        if self._state is None:
+            return
+        bloom = self._state[0]
+        bloom.add(token_hash)
+        if bloom.count > bloom.capacity:
+            self._stale = True
+
+    def _fresh(self, rebuild_interval):
+        return (
+            not self._stale
+            and self._rebuilt_at is not None
+            and time.monotonic() - self._rebuilt_at < rebuild_interval
+        )
+
+    def _build(self):
+        built_at = time.time()
+        hashes = (
+            db.session.execute(
+                select(Token.refresh_token).where(Token.refresh_expiration > get_date())
+            )
+            .scalars()
+            .all()
+        )
+        bloom = BloomFilter(max(len(hashes) * 2, 1024), ERROR_RATE)
+        for token_hash in hashes:
+            bloom.add(token_hash)
+        self._state = (bloom, built_at)
+        self._rebuilt_at = time.monotonic()
+        self._stale = False
+
+    def _build_in_background(self, app):
+        try:
+            with app.app_context():
+                self._build()
+        except Exception as e:
+            logger.warning("Refresh token filter rebuild failed: %s", e)
+        finally:
+            self._rebuilding = False
+
+    def rebuild(self, rebuild_interval=300):
+        """
+        Reload the live token hashes when the filter is older than
+        rebuild_interval
+
+        Only the first build runs in the calling request. Later ones load
+        the hashes in a background thread and swap the new filter in, the
+        current one answering meanwhile.
+        """
+        if self._fresh(rebuild_interval):
+            return
+        if self._state is None:
+            with self._lock:
+                if self._state is None:
+                    self._build()
+            return
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        thread = threading.Thread(
+            target=self._build_in_background,
+            args=(current_app._get_current_object(),),
+            daemon=True,
+        )
+        thread.start()
+        return thread
+
+    def might_exist(self, raw_token, token_hash, rebuild_interval=300):
+        """
+        Returns:
+            bool: False when the token is certainly not stored, True when it
+                has to be looked up
+        """
+        self.rebuild(rebuild_interval)
+        bloom, built_at = self._state
+        issued_at = Token.issued_at(raw_token)
+        if issued_at is not None:
+            if issued_at > time.time() + TRUST_MARGIN:
+                return False
+            if issued_at >= built_at - TRUST_MARGIN:
+                return True
+        return token_hash in bloom
+
+
+refresh_token_filter = RefreshTokenFilter()
@@ -0,0 +1,342 @@
+import base64
+import binascii
+import json
+from datetime import datetime, time, timezone
+
+from sqlalchemy import func, literal, select, text, tuple_
+
+from app import db
+from models.contractors import Contractor
+from models.enums import MethodEnum, TransactionStatus
+from models.transactions import Transaction
+from schema.transactions import TRANSACTION_ROW_COLUMNS
+from services.search import search_backend
+
+MAX_PER_PAGE = 100
+SORT_OPTIONS = ("date", "contractor", "amount", "relevance")
+TOTAL_MODES = ("exact", "estimate", "none")
+# <name>_from / <name>_to query parameters and the column they bound
+DATE_RANGES = {
+    "created": Transaction.created_at,
+    "sent": Transaction.sent_at,
+    "payed": Transaction.payed_at,
+    "received": Transaction.received_at,
+}
+
+
+class TransactionQueryError(ValueError):
+    """Raised when request arguments can not be turned into a transaction query"""
+
+
+def parse_datetime_arg(value, name, end_of_day=False):
+    """
+    Parse a YYYY-MM-DD date or an ISO datetime into a naive UTC datetime
+
+    A bare date means its first moment, or its last one with end_of_day, so
+    both ends of a range are inclusive.
+
+    Raises:
+        TransactionQueryError: value is neither
+    """
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise TransactionQueryError(f"{name} must be a date or an ISO datetime")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    elif end_of_day and len(value) == 10:
+        parsed = datetime.combine(parsed.date(), time.max)
+    return parsed
+
+
+def parse_transaction_filters(args):
+    """Validate the get_transactions query parameters
+
+    Args:
+        args (MultiDict): request.args or any mapping with the same keys
+
+    Returns:
+        dict: normalized filters, sort and paging options
+
+    Raises:
+        TransactionQueryError: One of the parameters is invalid
+    """
+    sort_by = args.get("sort_by", "date")
+    # unknown sort keys have always fallen back to sorting by amount
+    if sort_by not in SORT_OPTIONS:
+        sort_by = "amount"
+    filters = {
+        "search": args.get("search"),
+        "sort_by": sort_by,
+        "sort_order": "desc" if args.get("sort_order", "desc").lower() == "desc" else "asc",
+        "status": None,
+        "contractor_id": None,
+        "cursor": args.get("cursor"),
+    }
+    try:
+        filters["page"] = int(args.get("page", 1))
+        filters["per_page"] = max(min(int(args.get("per_page", 20)), MAX_PER_PAGE), 1)
+    except (ValueError, TypeError):
+        raise TransactionQueryError("page and per_page must be valid integers")
+
+    contractor_id = args.get("contractor_id")
+    if contractor_id:
+        try:
+            filters["contractor_id"] = int(contractor_id)
+        except (ValueError, TypeError):
+            raise TransactionQueryError("contractor_id must be a valid integer")
+
+    status = args.get("status")
+    if status:
+        try:
+            filters["status"] = TransactionStatus(status)
+        except ValueError:
+            raise TransactionQueryError(f"Invalid status: {status}")
+
+    filters["method"] = None
+    method = args.get("method")
+    if method:
+        try:
+            filters["method"] = MethodEnum(method)
+        except ValueError:
+            raise TransactionQueryError(f"Invalid method: {method}")
+
+    filters["date_ranges"] = {}
+    for name in DATE_RANGES:
+        start, end = args.get(f"{name}_from"), args.get(f"{name}_to")
+        if start or end:
+            filters["date_ranges"][name] = (
+                parse_datetime_arg(start, f"{name}_from") if start else None,
+                parse_datetime_arg(end, f"{name}_to", end_of_day=True) if end else None,
+            )
+
+    for bound in ("amount_min", "amount_max"):
+        filters[bound] = None
+        if args.get(bound):
+            try:
+                filters[bound] = float(args[bound])
+            except (ValueError, TypeError):
+                raise TransactionQueryError(f"{bound} must be a number")
+
+    # Cursor pages skip the COUNT(*) unless it is asked for explicitly
+    default_total = "none" if "cursor" in args else "exact"
+    total = args.get("total", default_total).lower()
+    if total not in TOTAL_MODES:
+        raise TransactionQueryError(f"total must be one of {', '.join(TOTAL_MODES)}")
+    filters["total"] = total
+
+    if sort_by == "relevance":
+        if not filters["search"]:
+            raise TransactionQueryError("sort_by=relevance requires a search term")
+        if filters["cursor"] is not None:
+            raise TransactionQueryError("cursor pagination can not sort by relevance")
+    return filters
+
+
+def sort_column(sort_by):
+    if sort_by == "date":
+        return Transaction.created_at
+    if sort_by == "contractor":
+        return Contractor.name
+    return Transaction.amount
+
+
+def transaction_rows_select():
+    """Flat rows of TRANSACTION_ROW_COLUMNS, see schema.dump_transaction_row"""
+    return select(*TRANSACTION_ROW_COLUMNS).outerjoin(Contractor, Transaction.contractor)
+
+
+def build_transactions_select(filters, stmt=None, contractor_joined=False):
+    """Apply the search, filters and ordering of get_transactions to a select
+
+    Args:
+        filters (dict): Output of parse_transaction_filters
+        stmt (Select, optional): Statement to extend, defaults to
+            transaction_rows_select
+        contractor_joined (bool): Whether stmt already joins contractors
+
+    Returns:
+        Select: filtered and ordered statement, without paging applied
+    """
+    if stmt is None:
+        stmt = transaction_rows_select()
+        contractor_joined = True
+
+    matches = None
+    if filters.get("search"):
+        matches = search_backend().matches(filters["search"])
+        stmt = stmt.join(matches, matches.c.uid == Transaction.uid)
+
+    if filters.get("contractor_id"):
+        stmt = stmt.where(Transaction.contractor_id == filters["contractor_id"])
+
+    if filters.get("status"):
+        stmt = stmt.where(Transaction.status == filters["status"].value)
+
+    if filters.get("method"):
+        stmt = stmt.where(Transaction.method == filters["method"].value)
+
+    for name, (start, end) in (filters.get("date_ranges") or {}).items():
+        column = DATE_RANGES[name]
+        if start is not None:
+            stmt = stmt.where(column >= start)
+        if end is not None:
+            stmt = stmt.where(column <= end)
+
+    if filters.get("amount_min") is not None:
+        stmt = stmt.where(Transaction.amount >= filters["amount_min"])
+    if filters.get("amount_max") is not None:
+        stmt = stmt.where(Transaction.amount <= filters["amount_max"])
+
+    if filters["sort_by"] == "contractor":
+        if not contractor_joined:
+            stmt = stmt.join(Contractor, Transaction.contractor)
+        # sorting by contractor lists only transactions that have one, as an
+        # inner join would, which also keeps NULLs out of the cursor key
+        stmt = stmt.where(Contractor.name.is_not(None))
+
+    if filters["sort_by"] == "relevance":
+        return stmt.order_by(matches.c.rank.desc(), Transaction.uid.desc())
+
+    column = sort_column(filters["sort_by"])
+    # uid breaks ties so both offset and cursor pages have a stable order
+    if filters["sort_order"] == "desc":
+        return stmt.order_by(column.desc(), Transaction.uid.desc())
+    return stmt.order_by(column.asc(), Transaction.uid.asc())
+
+
+def encode_cursor(filters, value, uid):
+    """Build the opaque cursor pointing after the row with the given sort key"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = [filters["sort_by"], filters["sort_order"], value, uid]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(filters, cursor):
+    """
+    Decode a cursor produced by encode_cursor
+
+    Returns:
+        tuple: (sort value, uid) of the last row of the previous page
+
+    Raises:
+        TransactionQueryError: The cursor is malformed or was issued for a
+            different sort
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_by, sort_order, value, uid = json.loads(base64.urlsafe_b64decode(padded))
+        uid = int(uid)
+    except (ValueError, TypeError, binascii.Error):
+        raise TransactionQueryError("Invalid cursor")
+    if sort_by != filters["sort_by"] or sort_order != filters["sort_order"]:
+        raise TransactionQueryError("cursor does not match sort_by and sort_order")
+    if sort_by == "date":
+        try:
+            value = datetime.fromisoformat(value)
+        except (ValueError, TypeError):
+            raise TransactionQueryError("Invalid cursor")
+    return value, uid
+
+
+def apply_cursor(stmt, filters, value, uid):
+    """Restrict an ordered statement to rows after (value, uid)"""
+    column = sort_column(filters["sort_by"])
+    key = tuple_(column, Transaction.uid)
+    bound = tuple_(literal(value, column.type), literal(uid))
+    if filters["sort_order"] == "desc":
+        return stmt.where(key < bound)
+    return stmt.where(key > bound)
+
+
+def cursor_value(row, sort_by):
+    """Sort key of a transaction row as used by the cursor"""
+    if sort_by == "date":
+        return row.created_at
+    if sort_by == "contractor":
+        return row.contractor_name
+    return row.amount
+
+
+def count_transactions(stmt, mode, session=None):
+    """
+    Count the rows matched by stmt
+
+    Args:
+        stmt (Select): filtered statement
+        mode (str): "exact" runs COUNT(*), "estimate" reads the planner
+            estimate on PostgreSQL, "none" skips counting
+        session (Session, optional): defaults to db.session
+
+    Returns:
+        int | None: the total, or None when it is not available
+    """
+    if mode == "none":
+        return None
+    session = session or db.session
+    counted = stmt.order_by(None)
+    dialect = session.get_bind().dialect
+    if mode == "estimate" and dialect.name == "postgresql":
+        compiled = counted.compile(dialect=dialect, compile_kwargs={"literal_binds": True})
+        plan = session.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}")).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+    return session.execute(select(func.count()).select_from(counted.subquery())).scalar()
+
+
+def paginate_offset(stmt, filters, session=None):
+    """
+    Run a page/per_page query, counting only when filters["total"] asks to
+
+    Args:
+        session (Session, optional): defaults to db.session, the async read
+            mode passes the sync session of its AsyncSession
+
+    Returns:
+        tuple: (rows of the page, pagination dict)
+    """
+    session = session or db.session
+    page = max(filters["page"], 1)
+    per_page = filters["per_page"]
+    items = session.execute(stmt.limit(per_page + 1).offset((page - 1) * per_page)).all()
+    total = count_transactions(stmt, filters["total"], session)
+    has_next = len(items) > per_page
+    pages = None
+    if total is not None:
+        pages = -(-total // per_page) if per_page else 0
+    return items[:per_page], {
+        "page": page,
+        "per_page": per_page,
+        "total": total,
+        "pages": pages,
+        "has_prev": page > 1,
+        "has_next": has_next,
+    }
+
+
+def paginate_cursor(stmt, filters, session=None):
+    """Run a keyset page: no OFFSET scan and no COUNT(*) unless requested"""
+    session = session or db.session
+    per_page = filters["per_page"]
+    total = count_transactions(stmt, filters["total"], session)
+    if filters["cursor"]:
+        value, uid = decode_cursor(filters, filters["cursor"])
+        stmt = apply_cursor(stmt, filters, value, uid)
+    items = session.execute(stmt.limit(per_page + 1)).all()
+    has_next = len(items) > per_page
+    items = items[:per_page]
+    next_cursor = None
+    if has_next:
+        last = items[-1]
+        next_cursor = encode_cursor(
+            filters, cursor_value(last, filters["sort_by"]), last.uid
+        )
+    return items, {
+        "per_page": per_page,
+        "total": total,
+        "has_next": has_next,
+        "next_cursor": next_cursor,
+    }
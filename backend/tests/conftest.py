@@ -0,0 +1,37 @@
+import os
+import tempfile
+
+import pytest
+
+# config.py reads the environment on import, a throwaway SQLite file unless
+# SQLALCHEMY_DATABASE_URI_TEST points somewhere else
+_database = os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ.setdefault("SQLALCHEMY_DATABASE_URI_TEST", f"sqlite:///{_database}")
+os.environ.setdefault("SECRET_KEY", "test-only-secret-key-not-for-deployment")
+
+from app import create_app, db  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def app():
+    app = create_app("testing")
+    with app.app_context():
+        db.create_all(bind_key=None)
+        yield app
+        db.session.remove()
+        db.drop_all(bind_key=None)
+
+
+@pytest.fixture
+def session(app):
+    """db.session, with every table emptied after the test"""
+    yield db.session
+    db.session.rollback()
+    for table in reversed(db.metadata.sorted_tables):
+        db.session.execute(table.delete())
+    db.session.commit()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
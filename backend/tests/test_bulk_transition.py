@@ -0,0 +1,38 @@
+import pytest
+from sqlalchemy import insert
+
+from models.transactions import Transaction
+from models.user import User
+
+
+@pytest.fixture
+def transactions(session):
+    # DISABLE_AUTH signs every request in as user 1
+    session.execute(
+        insert(User),
+        {"uid": 1, "username": "transitionuser", "password_hash": "x", "is_verified": True},
+    )
+    session.add_all(Transaction(amount=10.0 + index) for index in range(3))
+    session.commit()
+
+
+@pytest.mark.parametrize(
+    "filter",
+    [{"total": True}, {"sort_order": None}, {"created_at_from": ["2024-01-01"]}, {"amount_min": {}}],
+)
+def test_non_text_filter_values_are_rejected(transactions, client, filter):
+    response = client.post(
+        "/api/transactions/transition", json={"status": "received", "filter": filter}
+    )
+
+    assert response.status_code == 400
+
+
+def test_numeric_filter_values_are_read_as_text(transactions, client):
+    response = client.post(
+        "/api/transactions/transition",
+        json={"status": "received", "filter": {"amount_min": 11, "sort_order": 1}},
+    )
+
+    assert response.status_code == 200
+    assert response.get_json()["updated"] == 2
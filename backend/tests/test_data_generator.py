@@ -0,0 +1,43 @@
+from datetime import datetime
+
+from models.enums import CurrencyEnum, MethodEnum, TransactionStatus
+from services import data_generator
+
+
+def test_generated_timestamps_follow_the_status_order():
+    data_generator.init_worker([1, 2, 3])
+    rows = data_generator.generate_chunk(
+        {
+            "index": 0,
+            "size": 500,
+            "seed": 1,
+            "end": datetime(2024, 1, 1),
+            "days": 30,
+            "amount_mu": 3,
+            "amount_sigma": 1,
+            "statuses": data_generator.parse_weights(
+                data_generator.DEFAULT_STATUS_WEIGHTS, TransactionStatus
+            ),
+            "currencies": data_generator.parse_weights(
+                data_generator.DEFAULT_CURRENCY_WEIGHTS, CurrencyEnum
+            ),
+            "methods": data_generator.parse_weights(
+                data_generator.DEFAULT_METHOD_WEIGHTS, MethodEnum
+            ),
+        }
+    )
+
+    for row in rows:
+        values = dict(zip(data_generator.TRANSACTION_COLUMNS, row))
+        stamps = [values["created_at"], values["sent_at"]]
+        if values["status"] != TransactionStatus.SENT.value:
+            stamps.append(values["received_at"])
+        else:
+            assert values["received_at"] is None
+        if values["status"] == TransactionStatus.PAYED.value:
+            stamps.append(values["payed_at"])
+        else:
+            assert values["payed_at"] is None
+        assert None not in stamps
+        assert stamps == sorted(stamps)
+        assert values["updated_at"] == stamps[-1]
@@ -0,0 +1,16 @@
+import pytest
+
+from models.idempotency import IdempotencyKey
+
+
+def test_sweep_expired_rejects_empty_batches(session):
+    with pytest.raises(ValueError):
+        IdempotencyKey.sweep_expired(batch_size=0)
+
+
+def test_sweep_idempotency_keys_command_rejects_empty_batches(app):
+    result = app.test_cli_runner().invoke(
+        args=["commands", "sweep-idempotency-keys", "--batch-size", "0"]
+    )
+
+    assert result.exit_code == 2
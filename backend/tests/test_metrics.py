@@ -0,0 +1,22 @@
+def test_metrics_require_the_metrics_token(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, "METRICS_TOKEN", "scrape-secret")
+
+    assert client.get("/api/metrics").status_code == 401
+    assert (
+        client.get("/api/metrics", headers={"Authorization": "Bearer wrong"}).status_code
+        == 401
+    )
+    response = client.get("/api/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200
+    assert "db_pool_checkouts_total" in response.get_data(as_text=True)
+
+
+def test_metrics_take_a_user_token_without_metrics_token(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, "METRICS_TOKEN", None)
+    monkeypatch.setitem(app.config, "DISABLE_AUTH", False)
+
+    assert client.get("/api/metrics").status_code == 401
+    assert (
+        client.get("/api/metrics", headers={"Authorization": "Bearer not-a-jwt"}).status_code
+        == 401
+    )
@@ -0,0 +1,26 @@
+import time
+
+import pytest
+from sqlalchemy import exc, text
+
+from app import db
+from services.metrics import start_stats, stop_stats
+
+
+def test_failed_statements_leave_no_timing_behind(app):
+    stats = start_stats()
+    try:
+        with db.engine.connect() as connection:
+            for _ in range(3):
+                with pytest.raises(exc.DBAPIError):
+                    connection.execute(text("SELECT * FROM no_such_table"))
+                connection.rollback()
+            # nothing left on the pooled connection for later statements to pick up
+            assert not connection.info.get("query_started")
+            time.sleep(0.2)
+            connection.execute(text("SELECT 1"))
+    finally:
+        stop_stats()
+
+    assert stats.queries == 1
+    assert stats.sql_time < 0.2
@@ -0,0 +1,31 @@
+import pytest
+
+from models.transactions import Transaction
+from services.transactions import MAX_PER_PAGE, parse_transaction_filters
+
+
+@pytest.fixture
+def transactions(session):
+    session.add_all(Transaction(amount=10.0 + index) for index in range(3))
+    session.commit()
+
+
+@pytest.mark.parametrize(
+    "per_page, expected", [("0", 1), ("-5", 1), ("7", 7), (str(MAX_PER_PAGE + 1), MAX_PER_PAGE)]
+)
+def test_per_page_is_clamped(per_page, expected):
+    assert parse_transaction_filters({"per_page": per_page})["per_page"] == expected
+
+
+@pytest.mark.parametrize("cursor", ["", None])
+@pytest.mark.parametrize("per_page", ["0", "-1"])
+def test_pages_below_one_item_return_one(transactions, client, per_page, cursor):
+    query = {"per_page": per_page}
+    if cursor is not None:
+        query["cursor"] = cursor
+    response = client.get("/api/get_transactions", query_string=query)
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert len(body["transactions"]) == 1
+    assert body["pagination"]["has_next"] is True
@@ -0,0 +1,67 @@
+import csv
+import gzip
+from datetime import datetime, time
+
+import pytest
+from sqlalchemy import func, select
+
+from app import db
+from models.contractors import Contractor
+from models.transactions import Transaction
+from services.archive import archive_partition, archive_path
+from services.partitions import (
+    add_months,
+    create_partitions,
+    list_partitions,
+    month_start,
+    partition_name,
+    partition_transactions,
+)
+from utils.utils import get_date
+
+
+@pytest.fixture
+def postgresql(app):
+    if db.engine.dialect.name != "postgresql":
+        pytest.skip("partitioning needs PostgreSQL, point SQLALCHEMY_DATABASE_URI_TEST at one")
+    yield
+    # back to the plain tables the other tests expect
+    db.session.remove()
+    db.drop_all(bind_key=None)
+    db.create_all(bind_key=None)
+
+
+def test_partition_insert_and_archive_a_month(session, postgresql, tmp_path):
+    this_month = month_start(get_date())
+    old_month = add_months(this_month, -2)
+    with db.engine.begin() as connection:
+        created, _ = partition_transactions(connection, months_ahead=1)
+    assert created == [partition_name(this_month), partition_name(add_months(this_month, 1))]
+
+    contractor = Contractor(name="Acme Co")
+    session.add_all(
+        [
+            # no partition for its month yet, lands in the default partition
+            Transaction(
+                contractor=contractor,
+                amount=1.0,
+                created_at=datetime.combine(old_month, time(12)),
+            ),
+            Transaction(contractor=contractor, amount=2.0, created_at=get_date()),
+        ]
+    )
+    session.commit()
+
+    with db.engine.begin() as connection:
+        # moves the row out of the default partition
+        create_partitions(connection, months_ahead=1, start=old_month)
+        assert (old_month, partition_name(old_month)) in list_partitions(connection)
+
+    assert archive_partition(db.engine, old_month, str(tmp_path)) == 1
+
+    with gzip.open(archive_path(str(tmp_path), old_month), "rt", newline="") as archive:
+        rows = list(csv.DictReader(archive))
+    assert [(row["amount"], row["contractor_name"]) for row in rows] == [("1.0", "Acme Co")]
+    with db.engine.connect() as connection:
+        assert partition_name(old_month) not in {name for _, name in list_partitions(connection)}
+    assert session.execute(select(func.count()).select_from(Transaction)).scalar() == 1
@@ -0,0 +1,44 @@
+import json
+import os
+import tempfile
+
+import config
+from app import create_app, db
+from utils.prefork import run_worker_hooks
+
+
+class PreloadConfig(config.TestingConfig):
+    SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "preload.db")
+    SQLALCHEMY_ENGINE_OPTIONS = {**config.engine_options(), "pool_size": 2}
+    REPLICA_DATABASE_URIS = []
+    POOL_WARMUP_CONNECTIONS = 2
+    PRELOAD_APP = True
+
+
+def test_pools_are_warmed_in_the_worker_not_the_master(monkeypatch):
+    monkeypatch.setitem(config.config, "preload", PreloadConfig)
+    monkeypatch.setattr("utils.prefork._worker_hooks", [])
+    app = create_app("preload")
+    with app.app_context():
+        pool = db.engine.pool
+    stats = pool.stats
+    assert stats.connects == 0 and pool.checkedin() == 0
+
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker_hooks()
+            with app.app_context():
+                result = {"connects": stats.connects, "idle": db.engine.pool.checkedin()}
+            os.write(write, json.dumps(result).encode())
+        finally:
+            os._exit(0)
+    os.close(write)
+    with os.fdopen(read) as pipe:
+        child = json.loads(pipe.read())
+    os.waitpid(pid, 0)
+
+    assert child == {"connects": 2, "idle": 2}
+    # the master keeps no connection of its own
+    assert pool.checkedin() == 0
@@ -0,0 +1,66 @@
+import pytest
+from sqlalchemy import func, insert, select
+
+from models.enums import CurrencyEnum
+from models.transactions import Transaction
+from models.user import User
+from services.query_budget import BUDGET_HEADER, QueryBudgetExceeded, assert_max_queries
+
+
+@pytest.fixture
+def transactions(session, client):
+    # DISABLE_AUTH signs every request in as user 1
+    session.execute(
+        insert(User),
+        {"uid": 1, "username": "budgetuser", "password_hash": "x", "is_verified": True},
+    )
+    session.commit()
+    for index in range(5):
+        response = client.post(
+            "/api/add_transaction",
+            json={"contractor_name": f"Acme Co {index % 2}", "amount": 12.5 + index},
+        )
+        assert response.status_code == 201
+
+
+@pytest.mark.parametrize(
+    "path, max_queries",
+    [
+        ("/api/get_transactions", 5),
+        ("/api/get_transactions?sort_by=amount&cursor=", 5),
+        ("/api/get_contractors", 4),
+        ("/api/transactions/summary", 4),
+        ("/api/transactions/balance", 2 * len(CurrencyEnum) + 1),
+        ("/api/transactions/running_balance", 6),
+    ],
+)
+def test_endpoints_stay_within_budget(transactions, client, path, max_queries):
+    with assert_max_queries(max_queries):
+        response = client.get(path)
+    assert response.status_code == 200
+
+
+def test_assert_max_queries_counts_the_request(transactions, client):
+    with pytest.raises(QueryBudgetExceeded):
+        with assert_max_queries(0):
+            client.get("/api/transactions/balance")
+
+
+def test_write_over_budget_is_kept_and_flagged(app, session, transactions, client, monkeypatch):
+    monkeypatch.setattr(app.view_functions["transactions.add_transaction"], "query_budget", 1)
+
+    response = client.post("/api/add_transaction", json={"contractor_name": "Acme Co", "amount": 1})
+
+    assert response.status_code == 201
+    assert "budget is 1" in response.headers[BUDGET_HEADER]
+    assert session.execute(select(func.count()).select_from(Transaction)).scalar() == 6
+
+
+def test_read_over_budget_fails(app, session, transactions, client, monkeypatch):
+    uid = session.execute(select(func.min(Transaction.uid))).scalar()
+    assert client.get(f"/api/get_transaction/{uid}").status_code == 200
+    monkeypatch.setattr(app.view_functions["transactions.get_transaction"], "query_budget", 0)
+
+    # a new data version so the response is not served from the cache
+    client.post("/api/add_transaction", json={"contractor_name": "Acme Co", "amount": 1})
+    assert client.get(f"/api/get_transaction/{uid}").status_code == 500
@@ -0,0 +1,45 @@
+import os
+import tempfile
+
+from sqlalchemy import insert, select
+
+import config
+from app import create_app, db
+from models.token import Token, token_versions
+from models.user import User
+
+
+class ReplicaConfig(config.TestingConfig):
+    SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "primary.db")
+    REPLICA_DATABASE_URIS = ["sqlite:///" + os.path.join(tempfile.mkdtemp(), "replica.db")]
+    REPLICA_MAX_LAG_SECONDS = 0
+
+
+def test_token_version_is_read_from_the_primary(monkeypatch):
+    monkeypatch.setitem(config.config, "replicas", ReplicaConfig)
+    app = create_app("replicas")
+    with app.app_context():
+        db.create_all(bind_key=None)
+        replica = db.engines["replica_0"]
+        db.metadata.create_all(replica)
+        user = {
+            "uid": 1,
+            "username": "replicauser",
+            "password_hash": "x",
+            "is_verified": True,
+        }
+        # the replica has not replayed the revocation yet
+        with replica.begin() as connection:
+            connection.execute(insert(User), {**user, "token_version": 0})
+        db.session.execute(insert(User), {**user, "token_version": 1})
+        db.session.commit()
+        access_token = Token(user_id=1).get_access_jwt()
+        db.session.remove()
+        token_versions.clear()
+
+        with app.test_request_context("/api/get_transactions", method="GET"):
+            assert db.session.execute(select(User.token_version)).scalar() == 0
+            user = Token.verify_access_token(access_token)
+            assert user is not None and user.token_version == 1
+            db.session.remove()
+        token_versions.clear()
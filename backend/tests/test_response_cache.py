@@ -0,0 +1,13 @@
+def test_cached_responses_are_validated_by_etag_only(client):
+    response = client.get("/api/get_transactions")
+
+    assert response.status_code == 200
+    assert response.headers.get("ETag")
+    assert "Last-Modified" not in response.headers
+    assert client.get(
+        "/api/get_transactions", headers={"If-None-Match": response.headers["ETag"]}
+    ).status_code == 304
+    # If-Modified-Since alone can not be answered without a shared change time
+    assert client.get(
+        "/api/get_transactions", headers={"If-Modified-Since": "Wed, 21 Oct 2099 07:28:00 GMT"}
+    ).status_code == 200
@@ -0,0 +1,34 @@
+from datetime import date
+
+from sqlalchemy import func, select
+
+from models.contractors import Contractor
+from models.rollups import TransactionRollup
+
+
+def test_apply_merges_groups_without_contractor(session):
+    key = (None, "sent", "USD", date(2024, 1, 1))
+    TransactionRollup.apply({key: (1, 10.0)})
+    TransactionRollup.apply({key: (2, 5.0)})
+    session.commit()
+
+    rows = session.execute(
+        select(TransactionRollup.transaction_count, TransactionRollup.total_amount)
+    ).all()
+    assert rows == [(3, 15.0)]
+
+
+def test_apply_keeps_contractor_groups_apart(session):
+    contractor = Contractor(name="Acme Co")
+    session.add(contractor)
+    session.flush()
+    day = date(2024, 1, 1)
+    TransactionRollup.apply(
+        {
+            (None, "sent", "USD", day): (1, 10.0),
+            (contractor.uid, "sent", "USD", day): (1, 20.0),
+        }
+    )
+    session.commit()
+
+    assert session.execute(select(func.count()).select_from(TransactionRollup)).scalar() == 2
@@ -0,0 +1,134 @@
+import pytest
+from sqlalchemy import text
+
+from app import db
+from models.contractors import Contractor
+from models.transactions import Transaction
+from services import search
+from services.transactions import build_transactions_select, parse_transaction_filters
+
+BACKENDS = {
+    "like": (search.TransactionSearch, None),
+    "fts5": (search.SqliteFtsSearch, "sqlite"),
+    "pg_trgm": (search.PostgresTrigramSearch, "postgresql"),
+}
+
+
+def drop_fts(session):
+    table = search.SqliteFtsSearch.table
+    for trigger in search.SqliteFtsSearch.triggers:
+        session.execute(text(f"DROP TRIGGER IF EXISTS {table}_{trigger}"))
+    session.execute(text(f"DROP TABLE IF EXISTS {table}"))
+    session.commit()
+
+
+def wait_for_refresh():
+    for thread in list(search._refreshing.values()):
+        thread.join()
+
+
+@pytest.fixture
+def sqlite_only(app):
+    if db.engine.dialect.name != "sqlite":
+        pytest.skip("uses the SQLite FTS5 backend")
+
+
+@pytest.fixture
+def transactions(session):
+    """uid by name of four transactions"""
+    globex = Contractor(name="Globex")
+    globex_trading = Contractor(name="Globex International Trading")
+    initech = Contractor(name="Initech")
+    rows = {
+        "globex": Transaction(contractor=globex, amount=12.5, tracking_id="ref-aaaa"),
+        "globex_trading": Transaction(
+            contractor=globex_trading, amount=112.5, tracking_id="ref-bbbb"
+        ),
+        "initech": Transaction(contractor=initech, amount=-12.5, tracking_id="ref-cccc"),
+        "no_contractor": Transaction(amount=40.0, tracking_id="globex-r"),
+    }
+    session.add_all(rows.values())
+    session.commit()
+    return {name: transaction.uid for name, transaction in rows.items()}
+
+
+@pytest.fixture(params=list(BACKENDS))
+def backend(request, app, session, monkeypatch):
+    backend_class, dialect = BACKENDS[request.param]
+    if dialect is not None and db.engine.dialect.name != dialect:
+        pytest.skip(f"{request.param} needs {dialect}")
+    backend = backend_class()
+    monkeypatch.setattr("services.transactions.search_backend", lambda: backend)
+    yield backend
+    if request.param == "fts5":
+        drop_fts(session)
+
+
+def found(session, term, sort_by="relevance"):
+    filters = parse_transaction_filters({"search": term, "sort_by": sort_by})
+    return [row.uid for row in session.execute(build_transactions_select(filters))]
+
+
+def test_search_matches_names_and_tracking_ids(session, transactions, backend):
+    backend.create_index()
+
+    assert set(found(session, "globex")) == {
+        transactions["globex"],
+        transactions["globex_trading"],
+        transactions["no_contractor"],
+    }
+    # terms too short for trigrams use ILIKE on every backend
+    assert set(found(session, "in")) == {
+        transactions["globex_trading"],
+        transactions["initech"],
+    }
+
+
+def test_search_matches_amounts_exactly(session, transactions, backend):
+    backend.create_index()
+
+    # payments are stored negated, 112.5 is not a match
+    assert set(found(session, "12.5")) == {transactions["globex"], transactions["initech"]}
+
+
+def test_search_ranks_closer_matches_first(session, transactions, backend):
+    backend.create_index()
+
+    uids = found(session, "globex")
+    if backend.name == "like":
+        # every match ranks the same, newest first
+        assert uids == sorted(uids, reverse=True)
+    else:
+        assert uids.index(transactions["globex"]) < uids.index(transactions["globex_trading"])
+
+
+def test_search_backend_notices_index_changes(app, session, sqlite_only, monkeypatch):
+    monkeypatch.setitem(app.config, "SEARCH_BACKEND_CHECK_SECONDS", 0)
+    search._backends.clear()
+    try:
+        assert search.search_backend().name == "like"
+        search.SqliteFtsSearch().create_index()
+        # the check runs in the background, the current backend is kept meanwhile
+        assert search.search_backend().name == "like"
+        wait_for_refresh()
+        assert search.search_backend().name == "fts5"
+        drop_fts(session)
+        search.search_backend()
+        wait_for_refresh()
+        assert search.search_backend().name == "like"
+    finally:
+        wait_for_refresh()
+        drop_fts(session)
+        search._backends.clear()
+
+
+def test_search_backend_is_cached(app, session, sqlite_only):
+    search._backends.clear()
+    try:
+        assert search.search_backend().name == "like"
+        search.SqliteFtsSearch().create_index()
+        assert search.search_backend().name == "like"
+        assert not search._refreshing
+    finally:
+        drop_fts(session)
+        search._backends.clear()
@@ -0,0 +1,49 @@
+from datetime import datetime
+from itertools import product
+
+from models.contractors import Contractor
+from models.enums import CurrencyEnum, MethodEnum, TransactionStatus
+from models.transactions import Transaction
+from schema.transactions import TransactionSchema, dump_transaction_row
+from services.transactions import transaction_rows_select
+
+
+def seed(session):
+    contractor = Contractor(name="Acme Co")
+    session.add(contractor)
+    session.flush()
+    moment = datetime(2024, 2, 29, 13, 45, 7, 123456)
+    transactions = []
+    for index, (status, currency, method) in enumerate(
+        product(TransactionStatus, CurrencyEnum, MethodEnum)
+    ):
+        transactions.append(
+            Transaction(
+                status=status,
+                currency=currency,
+                method=method,
+                amount=10.5 + index,
+                tracking_id=None if index % 2 else f"tracking-{index}",
+                # every other row without a contractor
+                contractor_id=None if index % 2 else contractor.uid,
+                created_at=moment,
+                updated_at=moment,
+                sent_at=moment,
+                received_at=moment if status != TransactionStatus.SENT else None,
+                payed_at=moment if status == TransactionStatus.PAYED else None,
+            )
+        )
+    session.add_all(transactions)
+    session.commit()
+
+
+def test_dump_transaction_row_matches_transaction_schema(session):
+    seed(session)
+    rows = session.execute(transaction_rows_select().order_by(Transaction.uid)).all()
+    transactions = Transaction.query.order_by(Transaction.uid).all()
+
+    assert len(rows) == len(TransactionStatus) * len(CurrencyEnum) * len(MethodEnum)
+    assert any(row.contractor_id is None for row in rows)
+    assert [dump_transaction_row(row) for row in rows] == TransactionSchema(
+        many=True
+    ).dump(transactions)
@@ -0,0 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# seconds a fresh import of app plus create_app may take, well above the
+# usual second so only real regressions (an eager heavy import) fail it
+STARTUP_BUDGET = float(os.environ.get("STARTUP_BUDGET_SECONDS") or 5)
+# run in a fresh interpreter so nothing is imported yet
+SCRIPT = """
+import time
+start = time.perf_counter()
+from app import create_app
+create_app("testing")
+seconds = time.perf_counter() - start
+import gc, json, sys
+print(json.dumps({
+    "seconds": seconds,
+    "modules": sorted(name for name in ("commands", "faker") if name in sys.modules),
+    "frozen": gc.get_freeze_count(),
+}))
+"""
+
+
+def startup():
+    output = subprocess.check_output([sys.executable, "-c", SCRIPT], cwd=BACKEND, text=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_create_app_leaves_cli_modules_unimported():
+    result = startup()
+
+    assert result["modules"] == []
+    # only the production config freezes the heap
+    assert result["frozen"] == 0
+
+
+def test_create_app_stays_within_startup_budget():
+    # the fastest of three runs, so a busy machine does not fail it
+    seconds = min(startup()["seconds"] for _ in range(3))
+
+    assert seconds < STARTUP_BUDGET
@@ -0,0 +1,42 @@
+import hashlib
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import insert
+
+from models.token import Token
+from models.user import User
+from services.token_filter import RefreshTokenFilter
+from utils.utils import get_date
+
+
+def store(session, raw_token):
+    token = Token(user_id=1)
+    token.refresh_token = hashlib.sha256(raw_token.encode()).hexdigest()
+    token.refresh_expiration = get_date() + timedelta(days=1)
+    session.add(token)
+    session.commit()
+    return token.refresh_token
+
+
+@pytest.fixture
+def user(session):
+    session.execute(
+        insert(User), {"uid": 1, "username": "filteruser", "password_hash": "x", "is_verified": True}
+    )
+    session.commit()
+
+
+def test_rebuild_swaps_in_a_filter_built_in_the_background(app, session, user):
+    token_filter = RefreshTokenFilter()
+    # tokens without a signed issue time are always checked against the filter
+    first = store(session, "first-token")
+    assert token_filter.might_exist("first-token", first)
+
+    second = store(session, "second-token")
+    assert not token_filter.might_exist("second-token", second)
+    thread = token_filter.rebuild(rebuild_interval=0)
+    thread.join()
+
+    assert token_filter.might_exist("second-token", second)
+    assert not token_filter.might_exist("third-token", "0" * 64)
@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, insert, select
+
+from models.token import Token
+from models.user import User
+from utils.utils import get_date
+
+
+@pytest.fixture
+def tokens(session):
+    session.execute(
+        insert(User), {"uid": 1, "username": "tokenuser", "password_hash": "x", "is_verified": True}
+    )
+    now = get_date()
+    for index in range(5):
+        token = Token(user_id=1)
+        token.refresh_token = f"{index:064x}"
+        # three expired, two live
+        token.refresh_expiration = now + timedelta(days=1 if index >= 3 else -1)
+        session.add(token)
+    session.commit()
+
+
+def test_sweep_expired_deletes_in_batches(session, tokens):
+    assert Token.sweep_expired(batch_size=2) == 3
+    assert session.execute(select(func.count()).select_from(Token)).scalar() == 2
+
+
+def test_sweep_expired_rejects_empty_batches(session, tokens):
+    with pytest.raises(ValueError):
+        Token.sweep_expired(batch_size=0)
+
+
+def test_sweep_tokens_command_rejects_empty_batches(app):
+    result = app.test_cli_runner().invoke(
+        args=["commands", "sweep-tokens", "--batch-size", "0"]
+    )
+
+    assert result.exit_code == 2
+    assert "--batch-size" in result.output
@@ -0,0 +1,33 @@
+import importlib
+
+import click
+
+
+class LazyGroup(click.Group):
+    """
+    Click group whose commands are imported the first time they are listed
+    or run, so web workers never import CLI only dependencies
+
+    Args:
+        name (str): Group name on the command line
+        import_path (str): "module:attribute" of a Blueprint or click group
+    """
+
+    def __init__(self, name, import_path, **kwargs):
+        super().__init__(name, **kwargs)
+        self.import_path = import_path
+        self._group = None
+
+    def _load(self):
+        if self._group is None:
+            module, attribute = self.import_path.split(":")
+            target = getattr(importlib.import_module(module), attribute)
+            # a Blueprint keeps its commands in an AppGroup
+            self._group = getattr(target, "cli", target)
+        return self._group
+
+    def list_commands(self, ctx):
+        return self._load().list_commands(ctx)
+
+    def get_command(self, ctx, name):
+        return self._load().get_command(ctx, name)
@@ -0,0 +1,23 @@
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+
+
+def upsert_insert(model):
+    """
+    Dialect specific INSERT supporting ON CONFLICT clauses
+
+    Args:
+        model: Model class or table to insert into
+
+    Returns:
+        Insert: postgresql/sqlite insert with on_conflict_do_* available, or a
+            plain insert for other dialects
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    return insert(model)
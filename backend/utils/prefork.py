@@ -0,0 +1,51 @@
+import gc
+import os
+import weakref
+
+# engines of every app created in this process
+_engines = weakref.WeakSet()
+_registered = False
+# callables run in every gunicorn worker right after the fork, see run_worker_hooks
+_worker_hooks = []
+
+
+def _dispose_inherited():
+    for engine in list(_engines):
+        # close=False leaves the sockets to the parent, which still uses them
+        engine.dispose(close=False)
+
+
+def dispose_after_fork(engines):
+    """
+    Give forked children (gunicorn --preload workers, multiprocessing) fresh
+    pools instead of connections shared with their parent
+    """
+    global _registered
+    _engines.update(engines)
+    if not _registered and hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_dispose_inherited)
+        _registered = True
+
+
+def freeze_heap():
+    """
+    Move everything allocated so far out of the garbage collector's reach,
+    so collections in forked workers do not touch, and copy, the pages
+    shared with the master
+    """
+    gc.collect()
+    gc.freeze()
+
+
+def after_worker_fork(callback):
+    """
+    Run callback in each server worker instead of the preloading master,
+    for work such as opening connections that must belong to the worker
+    """
+    _worker_hooks.append(callback)
+
+
+def run_worker_hooks():
+    """Called by the gunicorn post_fork hook, see gunicorn.conf.py"""
+    for callback in _worker_hooks:
+        callback()
@@ -0,0 +1,164 @@
+"""
+Primary/replica routing for db.session
+
+Replicas are extra SQLALCHEMY_BINDS named replica_0, replica_1, ... built from
+REPLICA_DATABASE_URIS. Plain SELECTs issued while handling a GET or HEAD
+request are sent to the replicas, picked round robin per request.
+
+Reads within one request all use the same replica. Writes, and reads that
+must see them, go to the primary:
+
+- writes, SELECT ... FOR UPDATE and raw SQL
+- selects with the use_primary execution option, for reads that must not be
+  stale such as the token version checked on every authenticated request
+- every statement after the session wrote something in this request
+- every request that is not a GET or HEAD, so read-modify-write views never
+  read stale rows
+- all reads for REPLICA_MAX_LAG_SECONDS after this process committed a write,
+  so a client reading back what it just wrote sees it
+- replicas whose measured lag (PostgreSQL only) exceeds REPLICA_MAX_LAG_SECONDS
+"""
+import itertools
+import logging
+import threading
+import time
+
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select, event, text
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND_PREFIX = "replica_"
+READ_METHODS = ("GET", "HEAD")
+# session.info key, set once the session wrote to the primary
+PRIMARY_PINNED = "replica_primary_pinned"
+PENDING_WRITE = "replica_pending_write"
+# statement execution option sending a single read to the primary
+USE_PRIMARY = "use_primary"
+# session.info key of the replica every read of the request uses
+SESSION_REPLICA = "replica_engine"
+
+# seconds the replica is behind, 0 when it has replayed everything it received
+POSTGRES_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+    "END"
+)
+
+
+def replica_binds(uris):
+    """Map replica bind keys to the given database uris"""
+    return {f"{REPLICA_BIND_PREFIX}{i}": uri for i, uri in enumerate(uris)}
+
+
+class ReplicaRouter:
+    """Round robin choice of a replica engine that is not too far behind"""
+
+    def __init__(self, bind_keys, max_lag=1.0, lag_check_interval=5.0):
+        self.bind_keys = list(bind_keys)
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self._next = itertools.count()
+        self._lag = {}
+        self._lag_lock = threading.Lock()
+        self._last_write = float("-inf")
+
+    def wrote(self):
+        self._last_write = time.monotonic()
+
+    def lag(self, bind_key, engine):
+        """
+        Returns:
+            float: seconds the replica is behind, cached for lag_check_interval,
+                inf when it could not be reached
+        """
+        now = time.monotonic()
+        checked = self._lag.get(bind_key)
+        if checked is not None and now - checked[0] < self.lag_check_interval:
+            return checked[1]
+        with self._lag_lock:
+            checked = self._lag.get(bind_key)
+            if checked is not None and now - checked[0] < self.lag_check_interval:
+                return checked[1]
+            if engine.dialect.name != "postgresql":
+                lag = 0.0
+            else:
+                try:
+                    with engine.connect() as connection:
+                        lag = float(connection.execute(POSTGRES_LAG_SQL).scalar() or 0)
+                except Exception as e:
+                    logger.warning("Replica %s unavailable: %s", bind_key, e)
+                    lag = float("inf")
+            self._lag[bind_key] = (now, lag)
+            return lag
+
+    def pick(self, engines):
+        """
+        Returns:
+            Engine: next replica within the lag tolerance, None to use the primary
+        """
+        if not self.bind_keys or time.monotonic() - self._last_write < self.max_lag:
+            return None
+        for _ in range(len(self.bind_keys)):
+            bind_key = self.bind_keys[next(self._next) % len(self.bind_keys)]
+            engine = engines[bind_key]
+            if self.lag(bind_key, engine) <= self.max_lag:
+                return engine
+        return None
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session sending safe reads to the replica binds"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        primary = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or clause is None or self.info.get(PRIMARY_PINNED):
+            return primary
+        if not isinstance(clause, Select) or clause._for_update_arg is not None:
+            self.info[PRIMARY_PINNED] = True
+            self.info[PENDING_WRITE] = True
+            return primary
+        if clause._execution_options.get(USE_PRIMARY):
+            return primary
+        if not has_request_context() or request.method not in READ_METHODS:
+            return primary
+        engines = self._db.engines
+        # models bound to other binds keep their own engine
+        if primary is not engines.get(None):
+            return primary
+        if SESSION_REPLICA not in self.info:
+            router = current_app.extensions.get("replicas")
+            # one replica per request so its reads see one consistent snapshot
+            self.info[SESSION_REPLICA] = router.pick(engines) if router else None
+        return self.info[SESSION_REPLICA] or primary
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _pin_after_flush(session, flush_context):
+    session.info[PRIMARY_PINNED] = True
+    session.info[PENDING_WRITE] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _record_write(session):
+    if session.info.pop(PENDING_WRITE, False):
+        router = current_app.extensions.get("replicas")
+        if router is not None:
+            router.wrote()
+
+
+def configure_replicas(app):
+    """
+    Add the replica binds to SQLALCHEMY_BINDS, must run before db.init_app
+    """
+    uris = app.config.get("REPLICA_DATABASE_URIS") or []
+    if not uris:
+        return
+    binds = replica_binds(uris)
+    app.config["SQLALCHEMY_BINDS"] = {**(app.config.get("SQLALCHEMY_BINDS") or {}), **binds}
+    app.extensions["replicas"] = ReplicaRouter(
+        binds,
+        app.config.get("REPLICA_MAX_LAG_SECONDS", 1.0),
+        app.config.get("REPLICA_LAG_CHECK_SECONDS", 5.0),
+    )
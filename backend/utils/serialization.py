@@ -0,0 +1,20 @@
+import json
+
+from flask import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(payload):
+    """Encode payload as compact JSON bytes with sorted keys, using orjson when installed"""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+
+
+def json_response(payload, status=200):
+    """jsonify replacement for hot endpoints whose payload is already plain data"""
+    return Response(dumps(payload), status=status, mimetype="application/json")
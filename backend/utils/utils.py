@@ -3,3 +3,8 @@ import datetime
 
 def get_date(tz=None):
     return datetime.datetime.now(tz)
+
+
+def normalize_name(name):
+    """Case and whitespace insensitive form of a name used for lookups"""
+    return " ".join(name.split()).casefold()